@@ -3,12 +3,18 @@ import logging
 import boto3
 from boto3.dynamodb.conditions import Key
 import re
-from os.path import basename
+from media_types import media_type, SNIFF_SIZE
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 TABLE_NAME = os.getenv("TABLE_NAME", "")
 AWS_REGION = os.getenv("AWS_REGION", "us-west-2")
 
+MEDIA_TYPE_SNIFF = os.getenv("MEDIA_TYPE_SNIFF", "False").capitalize()
+
+TS_PATTERN = re.compile("^[0-9]{8}$")
+# eg.: "IMG_0001.640w.jpg" is the 640px wide rendition of "IMG_0001.jpg"
+RENDITION_PATTERN = re.compile("^(.+)[.]([0-9]+)w([.][a-z-A-Z-0-9]+)$")
+
 logger = logging.getLogger()
 logger.setLevel(LOG_LEVEL)
 dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
@@ -36,35 +42,27 @@ def lambda_handler(event: dict = None, context: dict = None) -> bool:
     path = f"{key[0]}/{key[1]}/{key[2]}"
     url = f"https://s3-{AWS_REGION}.amazonaws.com/{bucket_name}/{path}/{name}"
 
-    supported_pictures_formats = [
-        ".jpg",
-        ".jpeg",
-        ".png",
-        ".gif",
-    ]
-    supported_movies_formats = [
-        ".mov",
-        ".m4v",
-        ".mp4",
-        ".ogg",
-        ".mpg",
-        ".mpeg",
-    ]
-
-    pictures = [(item, item.upper()) for item in supported_pictures_formats]
-    movies = [(item, item.upper()) for item in supported_movies_formats]
-
-    # picture_types = [item for item in supported_pictures_formats]
-    # picture_types_list = picture_types.extend([item.upper() for item in supported_pictures_formats])
-    # movie_types = [item for item in supported_movies_formats]
-    # movie_types_list = movie_types.extend([item.upper() for item in supported_pictures_formats])
-
-    if list(filter(name.endswith, pictures)) != []:
-        kind = "picture"
-    elif list(filter(name.endswith, movies)) != []:
-        kind = "movie"
-    else:
+    if RENDITION_PATTERN.match(name):
+        # renditions are attached to their original media by manage
+        logger.info(f"Object {name} is a rendition, skipping.")
+        return True
+
+    if name == "" or TS_PATTERN.match(name):
         kind = "folder"
+    else:
+        kind = media_type(name)
+        if (
+            kind is None
+            and MEDIA_TYPE_SNIFF == "True"
+            and "ObjectCreated" in event_name
+        ):
+            kind = media_type(
+                name, get_object_header(bucket_name, root_key), True
+            )
+
+    if kind is None:
+        logger.warning(f"Object {name} is not a supported media, skipping.")
+        return False
 
     logger.info("*** CONTEXT ***")
     logger.info(f"The S3 event name is: {event_name}")
@@ -99,10 +97,7 @@ def lambda_handler(event: dict = None, context: dict = None) -> bool:
 
                 return True
     elif "ObjectRemoved" in event_name:
-        pattern = re.compile("^[0-9]{8}$")
-        is_ts = pattern.match(basename(root_key))
-
-        if kind == "folder" or is_ts:
+        if kind == "folder":
             logger.debug("## DELETE CARD")
             delete_card(ts)
             logger.info("Card successfully removed from DB.")
@@ -131,6 +126,21 @@ def lambda_handler(event: dict = None, context: dict = None) -> bool:
 # assets/20160720/DSCN0206.JPG
 
 
+def get_object_header(bucket_name: str = None, key: str = None) -> bytes:
+    """ Get the first bytes of an object, used to identify files without extension """
+
+    try:
+        response = boto3.client("s3", region_name=AWS_REGION).get_object(
+            Bucket=bucket_name, Key=key, Range=f"bytes=0-{SNIFF_SIZE - 1}"
+        )
+        header = response["Body"].read()
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    return header
+
+
 def get_card_by_ts(ts: str = None) -> dict:
     """ Get cards by 'ts' """
 
@@ -0,0 +1,135 @@
+"""
+Compare the thread-pool and asyncio cloud backends against a local moto server.
+
+Both backends upload the same generated files, list them back, send SQS
+messages and seed DynamoDB items; the asyncio backend needs aiobotocore.
+
+usage (from manage/src):
+    python ../benchmarks/bench_async.py [files] [file size KB] [items]
+"""
+
+import os
+import sys
+import logging
+import time
+import socket
+import tempfile
+
+MANAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(MANAGE_PATH, "src"))
+
+BUCKET = "bench-bucket"
+PREFIX = "static/bench"
+REGION = "us-east-1"
+QUEUE = "bench-queue"
+TABLE = "bench-table"
+
+
+def free_port() -> int:
+    """ Returns an unused local TCP port """
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main() -> None:
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    items = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    from moto.server import ThreadedMotoServer
+
+    port = free_port()
+    server = ThreadedMotoServer(port=port, verbose=False)
+    server.start()
+
+    workdir = tempfile.TemporaryDirectory()
+    # constants.py loads "../.env" over the environment: run from a copy
+    # of manage/.env with the benchmark settings last
+    settings = {
+        "AWS_REGION": REGION,
+        "BUCKET_NAME": BUCKET,
+        "S3_PREFIX": PREFIX,
+        "QUEUE_NAME": QUEUE,
+        "TABLE_NAME": TABLE,
+        "FILES_LIST_PATH": workdir.name,
+        "LOG_PATH": workdir.name,
+        "CONFIG_PATH": f"{MANAGE_PATH}/config",
+    }
+    with open(f"{MANAGE_PATH}/.env") as r:
+        defaults = r.read()
+    with open(f"{workdir.name}/.env", "w") as w:
+        w.write(defaults)
+        w.writelines(f'{name}="{value}"\n' for name, value in settings.items())
+    os.makedirs(f"{workdir.name}/run")
+    os.chdir(f"{workdir.name}/run")
+    os.environ.update(
+        {
+            "AWS_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "AWS_DEFAULT_REGION": REGION,
+        }
+    )
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    import boto3
+    from init import logger
+    from async_backend import set_backend, use_asyncio
+    from s3 import upload_files, get_s3_files
+    from media_queue import send_batch_to_queue
+    from db import seed_db_table
+
+    # per file/batch logs would time the terminal
+    logger.setLevel(logging.WARNING)
+
+    boto3.client("s3").create_bucket(Bucket=BUCKET)
+    boto3.client("sqs").create_queue(QueueName=QUEUE)
+    boto3.client("dynamodb").create_table(
+        TableName=TABLE,
+        AttributeDefinitions=[{"AttributeName": "ts", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "ts", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+    medias = []
+    payload = os.urandom(size_kb * 1024)
+    for i in range(files):
+        folder = f"{workdir.name}/output/{20200101 + i % 28}"
+        os.makedirs(folder, exist_ok=True)
+        medias.append(f"{folder}/{i}.jpg")
+        with open(medias[-1], "wb") as w:
+            w.write(payload)
+
+    messages = [f'{{"src": "{i}.mp4"}}' for i in range(items)]
+    records = [{"ts": str(i), "medias": ["a.jpg"]} for i in range(items)]
+    operations = (
+        ("upload", files, lambda: upload_files(medias)),
+        ("list", files, lambda: get_s3_files(save_to_disk=False)),
+        ("sqs send", items, lambda: send_batch_to_queue(messages)),
+        ("dynamodb write", items, lambda: seed_db_table(records)),
+    )
+
+    print(f"{files} file(s) of {size_kb} KB, {items} message(s)/item(s)")
+    print(f"{'operation':<16}{'backend':>10}{'wall (s)':>12}{'ops/s':>12}")
+    for backend in ("threads", "asyncio"):
+        set_backend(backend)
+        if backend == "asyncio" and not use_asyncio():
+            print(f"{'':<16}{backend:>10}{'(aiobotocore not installed)':>30}")
+            continue
+        for label, count, operation in operations:
+            tic = time.perf_counter()
+            operation()
+            wall = time.perf_counter() - tic
+            print(
+                f"{label:<16}{backend:>10}{wall:>12.3f}{count / wall:>12.1f}"
+            )
+
+    os.chdir("/")
+    workdir.cleanup()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
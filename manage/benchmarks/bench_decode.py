@@ -0,0 +1,89 @@
+"""
+Compare the default and fast (DCT scaled) picture decode paths.
+
+Each mode runs in a fresh process so peak RSS is not shared between runs.
+
+usage (from manage/src):
+    python ../benchmarks/bench_decode.py <pictures dir> [width] [height]
+"""
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+def peak_rss_mb() -> float:
+    """ Returns the peak RSS of the current process in MB """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def run_mode(
+    pictures: list, width: int, height: int, fast_decode: str
+) -> tuple:
+    """ Generate every picture with the selected decode path """
+
+    from PIL import Image
+    from media_generator import picture_generate
+
+    with tempfile.TemporaryDirectory() as output_path:
+        tic = time.perf_counter()
+        for i, picture in enumerate(pictures):
+            with Image.open(picture) as im:
+                picture_generate(
+                    im,
+                    f"{output_path}/{i}.jpg",
+                    width,
+                    height,
+                    image_fast_decode=fast_decode,
+                )
+        toc = time.perf_counter()
+
+    return (toc - tic, peak_rss_mb())
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    path = sys.argv[1]
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 430
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 400
+
+    pictures = sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.lower().endswith((".jpg", ".jpeg"))
+    )
+    if not pictures:
+        print(f'No JPEG files found in "{path}".')
+        sys.exit(1)
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{len(pictures)} picture(s) => {width}x{height}")
+    print(
+        f"{'mode':<10}{'wall (s)':>12}{'per file (ms)':>16}{'peak RSS (MB)':>16}"
+    )
+    for label, fast_decode in (("default", "False"), ("fast", "True")):
+        with ctx.Pool(1) as pool:
+            wall, rss_peak = pool.apply(
+                run_mode, (pictures, width, height, fast_decode)
+            )
+        print(
+            f"{label:<10}{wall:>12.3f}{wall * 1000 / len(pictures):>16.1f}"
+            f"{rss_peak:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
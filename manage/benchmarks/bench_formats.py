@@ -0,0 +1,78 @@
+"""
+Compare picture output formats: encode time and output size.
+
+Every source is decoded and resized once, then encoded with each format
+available in this Pillow build.
+
+usage (from manage/src):
+    python ../benchmarks/bench_formats.py <pictures dir> [width] [height]
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from PIL import Image  # noqa: E402
+from media_generator import (  # noqa: E402
+    IMAGE_ENCODERS,
+    image_encoder,
+    image_format_available,
+    picture_save,
+)
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    path = sys.argv[1]
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 430
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 400
+
+    pictures = sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".gif"))
+    )
+    if not pictures:
+        print(f'No pictures found in "{path}".')
+        sys.exit(1)
+
+    formats = [item for item in IMAGE_ENCODERS if image_format_available(item)]
+    encoders = {item: image_encoder(item) for item in formats}
+    results = {item: [0.0, 0] for item in formats}
+
+    for picture in pictures:
+        with Image.open(picture) as im:
+            im.thumbnail((width, height))
+            frame = im.copy()
+
+        for item in formats:
+            buffer = io.BytesIO()
+            tic = time.perf_counter()
+            picture_save(frame, buffer, encoders[item])
+            results[item][0] += time.perf_counter() - tic
+            results[item][1] += buffer.tell()
+
+    print(f"{len(pictures)} picture(s) => {width}x{height}")
+    print(
+        f"{'format':<18}{'encode (ms/file)':>18}{'bytes/file':>14}{'vs jpeg':>10}"
+    )
+    jpeg_bytes = results["jpeg"][1]
+    for item in formats:
+        seconds, size = results[item]
+        print(
+            f"{item:<18}{seconds * 1000 / len(pictures):>18.1f}"
+            f"{size // len(pictures):>14}{size / jpeg_bytes:>10.2f}"
+        )
+    for item in IMAGE_ENCODERS:
+        if item not in formats:
+            print(f"{item:<18}{'(not available)':>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import asyncio
+import os
+import time
+from os.path import basename
+from boto3.dynamodb.types import TypeSerializer
+from constants import (
+    BUCKET_NAME,
+    AWS_REGION,
+    S3_PREFIX,
+    QUEUE_NAME,
+    TABLE_NAME,
+    S3_MULTIPART_THRESHOLD_MB,
+    S3_MULTIPART_CHUNKSIZE_MB,
+    CLOUD_BACKEND,
+    CLOUD_ASYNC_CONCURRENCY,
+    S3_RETRY_MODE,
+    S3_MAX_ATTEMPTS,
+)
+from init import logger
+from throttle import wait_upload_async
+
+# optional asyncio backend (pip install aiobotocore)
+try:
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_session = None
+    AioConfig = None
+
+MB = 1024 * 1024
+# send_message_batch() and batch_write_item() limits
+SQS_BATCH_SIZE = 10
+DYNAMODB_BATCH_SIZE = 25
+DYNAMODB_MAX_RETRIES = 8
+
+# backend of this run, the cli --backend option overrides CLOUD_BACKEND
+backend = {"name": CLOUD_BACKEND, "warned": False}
+
+
+def set_backend(name: str = CLOUD_BACKEND) -> None:
+    """ Select the backend of this run ("threads"|"asyncio") """
+
+    assert name in ("threads", "asyncio")
+
+    backend["name"] = name
+    logger.debug(f'Cloud operations backend: "{name}".')
+
+
+def use_asyncio() -> bool:
+    """ Returns True if cloud operations run on the asyncio backend """
+
+    if backend["name"] != "asyncio":
+        return False
+    elif get_session is None:
+        if not backend["warned"]:
+            logger.warning(
+                'The asyncio backend needs "aiobotocore", using threads.'
+            )
+            backend["warned"] = True
+        return False
+    else:
+        return True
+
+
+def run(coroutine=None):
+    """ Run a coroutine of this module from synchronous code """
+
+    return asyncio.run(coroutine)
+
+
+def async_client(
+    service: str = None,
+    aws_region: str = AWS_REGION,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+    s3_retry_mode: str = S3_RETRY_MODE,
+    s3_max_attempts: int = S3_MAX_ATTEMPTS,
+):
+    """ Returns an aiobotocore client context, its connection pool fits the semaphore """
+
+    return get_session().create_client(
+        service,
+        region_name=aws_region,
+        config=AioConfig(
+            max_pool_connections=cloud_async_concurrency,
+            retries={
+                "mode": s3_retry_mode,
+                "total_max_attempts": s3_max_attempts,
+            },
+        ),
+    )
+
+
+def read_range(media_file: str = None, offset: int = 0, size: int = -1):
+    """ Returns size bytes of media_file from offset """
+
+    with open(media_file, "rb") as r:
+        r.seek(offset)
+        return r.read(size)
+
+
+async def put_file(
+    s3=None,
+    semaphore=None,
+    media_file: str = None,
+    bucket_name: str = None,
+    key: str = None,
+    s3_multipart_threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+    s3_multipart_chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
+) -> int:
+    """ Upload media_file, parts of large files are sent concurrently; returns its size """
+
+    loop = asyncio.get_running_loop()
+    size = os.path.getsize(media_file)
+
+    # the semaphore bounds requests, so at most that many bodies are in memory
+    if size < s3_multipart_threshold_mb * MB:
+        await wait_upload_async(size)
+        async with semaphore:
+            body = await loop.run_in_executor(None, read_range, media_file)
+            await s3.put_object(Bucket=bucket_name, Key=key, Body=body)
+        return size
+
+    part_size = s3_multipart_chunksize_mb * MB
+    await wait_upload_async(0)
+    upload_id = (
+        await s3.create_multipart_upload(Bucket=bucket_name, Key=key)
+    )["UploadId"]
+
+    async def put_part(number: int) -> dict:
+        await wait_upload_async(
+            min(part_size, size - (number - 1) * part_size)
+        )
+        async with semaphore:
+            body = await loop.run_in_executor(
+                None,
+                read_range,
+                media_file,
+                (number - 1) * part_size,
+                part_size,
+            )
+            response = await s3.upload_part(
+                Bucket=bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    try:
+        parts = await asyncio.gather(
+            *[
+                put_part(number)
+                for number in range(1, -(-size // part_size) + 1)
+            ]
+        )
+        await wait_upload_async(0)
+        await s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": list(parts)},
+        )
+    except Exception:
+        await s3.abort_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id
+        )
+        raise
+
+    return size
+
+
+async def upload_files_async(
+    medias: list = None,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+) -> dict:
+    """ Upload files of the output tree, returns uploaded/failed files and throughput """
+
+    assert medias is not None
+    assert type(medias) == list
+
+    results = {"uploaded": [], "failed": [], "bytes": 0, "seconds": 0.0}
+    semaphore = asyncio.Semaphore(cloud_async_concurrency)
+    tic = time.perf_counter()
+
+    async def upload(s3, media: str) -> None:
+        key = f"{s3_prefix}/{media.split('/')[-2]}/{basename(media)}"
+        try:
+            results["bytes"] += await put_file(
+                s3, semaphore, media, bucket_name, key
+            )
+            results["uploaded"].append(media)
+            logger.info(f'File "{media}" sent successfully to bucket: "{key}"')
+        except Exception as e:
+            logger.error(f'"{media}": {e}')
+            results["failed"].append(media)
+
+    async with async_client("s3", aws_region) as s3:
+        await asyncio.gather(*[upload(s3, media) for media in medias])
+
+    results["seconds"] = time.perf_counter() - tic
+
+    return results
+
+
+async def list_objects_async(
+    bucket_name: str = BUCKET_NAME,
+    prefix: str = None,
+    aws_region: str = AWS_REGION,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+) -> list:
+    """ Returns batches of objects under prefix: its direct objects, then one per partition """
+
+    semaphore = asyncio.Semaphore(cloud_async_concurrency)
+
+    async def list_pages(s3, **kwargs) -> tuple:
+        partitions = []
+        objects = []
+        paginator = s3.get_paginator("list_objects_v2")
+        async with semaphore:
+            async for page in paginator.paginate(Bucket=bucket_name, **kwargs):
+                partitions.extend(
+                    [item["Prefix"] for item in page.get("CommonPrefixes", [])]
+                )
+                objects.extend(page.get("Contents", []))
+        return (partitions, objects)
+
+    async with async_client("s3", aws_region) as s3:
+        partitions, objects = await list_pages(
+            s3, Prefix=prefix, Delimiter="/"
+        )
+        logger.debug(
+            f"{len(partitions)} partition(s) to list with {cloud_async_concurrency} concurrent request(s)."
+        )
+        listings = await asyncio.gather(
+            *[list_pages(s3, Prefix=item) for item in partitions]
+        )
+
+    return [objects] + [listing[1] for listing in listings]
+
+
+async def send_messages_async(
+    messages: list = None,
+    queue_name: str = QUEUE_NAME,
+    aws_region: str = AWS_REGION,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+) -> int:
+    """ Send messages to SQS queue in concurrent batches, returns the number sent """
+
+    assert messages is not None
+    assert type(messages) == list
+
+    semaphore = asyncio.Semaphore(cloud_async_concurrency)
+
+    async def send_batch(sqs, queue_url: str, batch: list) -> int:
+        async with semaphore:
+            response = await sqs.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(i), "MessageBody": message}
+                    for i, message in enumerate(batch)
+                ],
+            )
+        for failure in response.get("Failed", []):
+            logger.error(
+                f"Message not sent: {batch[int(failure['Id'])]} ({failure.get('Message')})"
+            )
+        return len(response.get("Successful", []))
+
+    async with async_client("sqs", aws_region) as sqs:
+        queues = await sqs.list_queues(QueueNamePrefix=queue_name)
+        queue_url = queues["QueueUrls"][0]
+        sent = await asyncio.gather(
+            *[
+                send_batch(sqs, queue_url, messages[i : i + SQS_BATCH_SIZE])
+                for i in range(0, len(messages), SQS_BATCH_SIZE)
+            ]
+        )
+
+    return sum(sent)
+
+
+async def batch_write_async(
+    items: list = None,
+    table_name: str = TABLE_NAME,
+    aws_region: str = AWS_REGION,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+) -> int:
+    """ Put items into DynamoDB table in concurrent batches, returns the number written """
+
+    assert items is not None
+    assert type(items) == list
+
+    semaphore = asyncio.Semaphore(cloud_async_concurrency)
+    serializer = TypeSerializer()
+
+    async def write_batch(dynamodb, batch: list) -> int:
+        requests = [
+            {
+                "PutRequest": {
+                    "Item": {
+                        name: serializer.serialize(value)
+                        for name, value in item.items()
+                    }
+                }
+            }
+            for item in batch
+        ]
+        # throttled items come back unprocessed: retry them with backoff
+        for attempt in range(DYNAMODB_MAX_RETRIES):
+            async with semaphore:
+                response = await dynamodb.batch_write_item(
+                    RequestItems={table_name: requests}
+                )
+            requests = response.get("UnprocessedItems", {}).get(table_name)
+            if not requests:
+                return len(batch)
+            await asyncio.sleep(0.05 * 2**attempt)
+        raise RuntimeError(
+            f"{len(requests)} item(s) still unprocessed after {DYNAMODB_MAX_RETRIES} attempts."
+        )
+
+    async with async_client("dynamodb", aws_region) as dynamodb:
+        written = await asyncio.gather(
+            *[
+                write_batch(dynamodb, items[i : i + DYNAMODB_BATCH_SIZE])
+                for i in range(0, len(items), DYNAMODB_BATCH_SIZE)
+            ]
+        )
+
+    return sum(written)
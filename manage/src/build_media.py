@@ -1,6 +1,6 @@
 from constants import AWS_REGION, BUCKET_NAME
 from init import logger, statistics
-from helpers import get_media_type
+from helpers import get_media_type, parse_rendition_name
 from operator import itemgetter
 import re
 from collections import defaultdict
@@ -21,6 +21,10 @@ def build_media_objects(
     )
 
     try:
+        # renditions are attached to their original media, not listed
+        names = {tuple(item.rsplit("/", 1)) for item in items}
+        renditions = defaultdict(list)
+
         for item in items:
             key = item.split("/")
             name = key[3]
@@ -29,6 +33,13 @@ def build_media_objects(
             path = f"{key[0]}/{key[1]}/{key[2]}"
             url = f"https://s3-{aws_region}.amazonaws.com/{bucket_name}/{path}/{name}"
 
+            rendition = parse_rendition_name(name)
+            if rendition and (path, rendition[0]) in names:
+                renditions[(path, rendition[0])].append(
+                    {"width": rendition[1], "url": url}
+                )
+                continue
+
             media_type = get_media_type(name)
 
             if ts != "" and name != "":
@@ -43,15 +54,24 @@ def build_media_objects(
                 logger.warning(f"ts = {ts} and name = {name}. Stopping here.")
                 return False
 
+        for media in mediaItems:
+            if (media["path"], media["name"]) in renditions:
+                media["renditions"] = sorted(
+                    renditions[(media["path"], media["name"])],
+                    key=itemgetter("width"),
+                )
+
         data = sorted(mediaItems, key=itemgetter("ts"), reverse=False)
 
         nbr_data = len(data)
-        nbr_items = len(items)
+        nbr_renditions = sum(len(item) for item in renditions.values())
+        nbr_items = len(items) - nbr_renditions
 
         statistics.append(["build_media_objects", len(data)])
 
         logger.info("Media list dictionaries built successfully.")
         logger.debug(f"{nbr_data} objects in media list.")
+        logger.debug(f"{nbr_renditions} renditions attached to media.")
 
         if nbr_data != nbr_items:
             logger.critical(
@@ -80,14 +100,15 @@ def build_card_objects(media_list: list = None) -> list:
     medias_list = defaultdict(list)
     try:
         for item in media_list:
-            medias_list[item["ts"]].append(
-                {
-                    "name": item["name"],
-                    "path": item["path"],
-                    "url": item["url"],
-                    "kind": item["kind"],
-                }
-            )
+            media = {
+                "name": item["name"],
+                "path": item["path"],
+                "url": item["url"],
+                "kind": item["kind"],
+            }
+            if "renditions" in item:
+                media["renditions"] = item["renditions"]
+            medias_list[item["ts"]].append(media)
         medias = [{"ts": k, "medias": v} for k, v in medias_list.items()]
 
         statistics.append(["build_card_objects", len(medias)])
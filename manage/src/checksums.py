@@ -0,0 +1,216 @@
+import base64
+import hashlib
+import math
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from constants import (
+    FILES_LIST_PATH,
+    S3_CHECKSUM_CACHE_FILENAME,
+    S3_MULTIPART_THRESHOLD_MB,
+    S3_MULTIPART_CHUNKSIZE_MB,
+    S3_CHECKSUM_ALGORITHM,
+    S3_HASH_WORKERS,
+)
+from init import logger
+from helpers import load_json_store, save_json_store, file_signature
+
+# CRC32C comes with the AWS CRT (pip install "boto3[crt]")
+try:
+    from awscrt.checksums import crc32c
+except ImportError:
+    crc32c = None
+
+MB = 1024 * 1024
+CRC_FUNCTIONS = {"crc32": zlib.crc32, "crc32c": crc32c}
+
+# hashing threads of a run share the cache
+checksum_cache_lock = threading.Lock()
+
+
+def load_checksum_cache(
+    files_list_path: str = FILES_LIST_PATH,
+    s3_checksum_cache_filename: str = S3_CHECKSUM_CACHE_FILENAME,
+) -> dict:
+    """ Load the local file => S3 checksums cache """
+
+    return load_json_store(f"{files_list_path}/{s3_checksum_cache_filename}")
+
+
+def save_checksum_cache(
+    checksum_cache: dict = None,
+    files_list_path: str = FILES_LIST_PATH,
+    s3_checksum_cache_filename: str = S3_CHECKSUM_CACHE_FILENAME,
+) -> bool:
+    """ Save the local file => S3 checksums cache """
+
+    with checksum_cache_lock:
+        save_json_store(
+            f"{files_list_path}/{s3_checksum_cache_filename}", checksum_cache
+        )
+    logger.debug(f"{len(checksum_cache)} entries saved to checksum cache.")
+
+    return True
+
+
+def checksum_algorithm(
+    s3_checksum_algorithm: str = S3_CHECKSUM_ALGORITHM,
+) -> str:
+    """ Returns the checksum sent with uploads besides MD5: "crc32"|"crc32c", None for MD5 only """
+
+    if s3_checksum_algorithm == "md5":
+        return None
+    elif s3_checksum_algorithm == "crc32c" and crc32c is None:
+        logger.warning('CRC32C needs the AWS CRT ("boto3[crt]"), using CRC32.')
+        return "crc32"
+    elif s3_checksum_algorithm in CRC_FUNCTIONS:
+        return s3_checksum_algorithm
+    else:
+        logger.warning(
+            f'Unknown checksum "{s3_checksum_algorithm}", using MD5 only.'
+        )
+        return None
+
+
+def compute_checksums(
+    file_path: str = None,
+    size: int = None,
+    part_size: int = None,
+    algorithm: str = None,
+) -> dict:
+    """ Returns the ETag and the base64 MD5 (and CRC) of every part of file_path, in a single streaming read """
+
+    if part_size == 0 or size < part_size:
+        part_size = max(size, 1)
+    md5s = []
+    crcs = []
+
+    with open(file_path, "rb") as r:
+        for part in range(max(1, math.ceil(size / part_size))):
+            md5 = hashlib.md5()
+            crc = 0
+            remaining = min(part_size, size - part * part_size)
+            while remaining > 0:
+                chunk = r.read(min(MB, remaining))
+                if not chunk:
+                    break
+                md5.update(chunk)
+                if algorithm:
+                    crc = CRC_FUNCTIONS[algorithm](chunk, crc)
+                remaining -= len(chunk)
+            md5s.append(md5.digest())
+            crcs.append(crc.to_bytes(4, "big"))
+
+    if len(md5s) == 1:
+        etag = md5s[0].hex()
+    else:
+        # multipart: md5 of the concatenated parts md5, then "-<parts count>"
+        etag = f"{hashlib.md5(b''.join(md5s)).hexdigest()}-{len(md5s)}"
+
+    checksums = {
+        "etag": etag,
+        "md5": [base64.b64encode(item).decode() for item in md5s],
+    }
+    if algorithm:
+        checksums[algorithm] = [
+            base64.b64encode(item).decode() for item in crcs
+        ]
+
+    return checksums
+
+
+def cached_checksums(
+    file_path: str = None,
+    part_size: int = None,
+    checksum_cache: dict = None,
+    algorithm: str = None,
+) -> dict:
+    """ Returns compute_checksums() of file_path, from checksum_cache when path/size/mtime did not change """
+
+    signature = file_signature(file_path)
+
+    with checksum_cache_lock:
+        entry = checksum_cache.get(file_path)
+        if (
+            entry
+            and entry["size"] == signature["size"]
+            and entry["mtime"] == signature["mtime"]
+        ):
+            checksums = entry.get("checksums", {})
+        else:
+            checksums = {}
+        cached = checksums.get(str(part_size))
+
+    if cached is None or (algorithm and algorithm not in cached):
+        cached = compute_checksums(
+            file_path, signature["size"], part_size, algorithm
+        )
+        with checksum_cache_lock:
+            checksums[str(part_size)] = cached
+            checksum_cache[file_path] = dict(signature, checksums=checksums)
+
+    return cached
+
+
+def etag_part_sizes(
+    size: int = None,
+    remote_etag: str = None,
+    s3_multipart_threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+    s3_multipart_chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
+) -> list:
+    """ Returns the part sizes (0: single PUT) remote_etag may have been computed with, most likely first """
+
+    if remote_etag is None:
+        if size < s3_multipart_threshold_mb * MB:
+            return [0]
+        else:
+            return [s3_multipart_chunksize_mb * MB]
+
+    if "-" not in remote_etag:
+        return [0]
+
+    # our settings, then the usual client defaults (boto3/aws-cli 8MB,
+    # 5MB minimum part, 16MB), then the smallest size giving that count
+    parts = int(remote_etag.split("-")[-1])
+    candidates = [
+        item * MB
+        for item in (s3_multipart_chunksize_mb, 8, 5, 16)
+        if math.ceil(size / (item * MB)) == parts
+    ]
+    candidates.append(math.ceil(size / parts / MB) * MB)
+
+    return list(dict.fromkeys(candidates))
+
+
+def local_etag(
+    file_path: str = None,
+    remote_etag: str = None,
+    checksum_cache: dict = None,
+) -> str:
+    """ Returns the S3 ETag of a local file comparable to remote_etag, cached by path/size/mtime """
+
+    size = file_signature(file_path)["size"]
+
+    for part_size in etag_part_sizes(size, remote_etag):
+        etag = cached_checksums(file_path, part_size, checksum_cache)["etag"]
+        if etag == remote_etag:
+            break
+
+    return etag
+
+
+def local_etags(
+    files: dict = None,
+    checksum_cache: dict = None,
+    s3_hash_workers: int = S3_HASH_WORKERS,
+) -> dict:
+    """ Returns {file: local_etag()} of {file: remote ETag}, files are hashed by a thread pool """
+
+    # hashlib/zlib release the GIL on large buffers, reads overlap too
+    with ThreadPoolExecutor(max_workers=s3_hash_workers) as executor:
+        etags = executor.map(
+            lambda item: local_etag(item[0], item[1], checksum_cache),
+            files.items(),
+        )
+
+        return dict(zip(files, etags))
@@ -4,27 +4,59 @@ from main import (
     setup_cloud_resources,
     hydrate_cloud_resources,
     monitor_remote_ops,
+    run_pipeline,
     # media_sync,
     s3_clean,
     statistics,
 )
 from init import log_files
-from s3 import medias_copy
+from constants import (
+    PIPELINE_MODE,
+    CLOUD_BACKEND,
+    S3_UPLOAD_MAX_MB_PER_S,
+    S3_UPLOAD_MAX_REQUESTS_PER_S,
+)
+from async_backend import set_backend
+from throttle import set_upload_limits
+from s3 import media_sync
 import os
 import time
 from tabulate import tabulate
 from local import process_local_movie_medias
 
-
 app = typer.Typer()
 
 
+@app.callback()
+def options(
+    backend: str = typer.Option(
+        CLOUD_BACKEND, help="Cloud operations backend: threads|asyncio"
+    ),
+    upload_mb_per_s: float = typer.Option(
+        S3_UPLOAD_MAX_MB_PER_S, help="Upload bandwidth limit, 0: unlimited"
+    ),
+    upload_requests_per_s: float = typer.Option(
+        S3_UPLOAD_MAX_REQUESTS_PER_S,
+        help="Upload request rate limit, 0: unlimited",
+    ),
+):
+    """ Options shared by every command """
+    if backend not in ("threads", "asyncio"):
+        raise typer.BadParameter(f'Unknown backend "{backend}".')
+    set_backend(backend)
+    set_upload_limits(upload_mb_per_s, upload_requests_per_s)
+
+
 @app.command()
 def run_all(tic=time.perf_counter()):
     """ Run the whole stack """
     cloud_setup(tic)
-    build_local(tic)
-    cloud_hydrate(tic)
+    if PIPELINE_MODE == "True":
+        build_upload(tic)
+        hydrate_cloud_resources(copy_medias=False)
+    else:
+        build_local(tic)
+        cloud_hydrate(tic)
     finalize(tic)
     monitor_remote_ops()
     typer.echo("- All tasks executed successfully -")
@@ -33,7 +65,18 @@ def run_all(tic=time.perf_counter()):
 @app.command()
 def build_local(tic=time.perf_counter()):
     """ Get local media files """
-    prepare_local_resources()
+    if not prepare_local_resources():
+        finalize(tic)
+        raise typer.Exit(code=1)
+    finalize(tic)
+
+
+@app.command()
+def build_upload(tic=time.perf_counter()):
+    """ Get local media files and upload outputs as they are generated """
+    if not run_pipeline():
+        finalize(tic)
+        raise typer.Exit(code=1)
     finalize(tic)
 
 
@@ -54,8 +97,7 @@ def cloud_hydrate(tic=time.perf_counter()):
 @app.command()
 def assets_sync(tic=time.perf_counter()):
     """ Synchronize media assets """
-    # media_sync()
-    medias_copy()
+    media_sync()
     finalize(tic)
 
 
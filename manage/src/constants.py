@@ -19,13 +19,103 @@ FILES_LIST_FILENAME = os.getenv("FILES_LIST_FILENAME", "s3_media_list.txt")
 CONFIG_PATH = os.getenv("CONFIG_PATH", "../config")
 OUTPUT_IMAGE_WIDTH = int(os.getenv("OUTPUT_IMAGE_WIDTH", 430))
 OUTPUT_IMAGE_HEIGHT = int(os.getenv("OUTPUT_IMAGE_HEIGHT", 400))
+IMAGE_FAST_DECODE = os.getenv("IMAGE_FAST_DECODE", "False").capitalize()
+IMAGE_REDUCING_GAP = float(os.getenv("IMAGE_REDUCING_GAP", 2.0))
+IMAGE_RENDITIONS = os.getenv("IMAGE_RENDITIONS", "")  # eg.: "320 640 1280"
+IMAGE_OUTPUT_FORMAT = os.getenv(
+    "IMAGE_OUTPUT_FORMAT", "jpeg"
+).lower()  # jpeg|progressive_jpeg|webp|avif
+IMAGE_OUTPUT_QUALITY = int(os.getenv("IMAGE_OUTPUT_QUALITY", 0))
 S3_PREFIX = os.getenv("S3_PREFIX")
 VIDEO_ENCODE = bool(os.getenv("VIDEO_ENCODE", False).capitalize())
 VIDEO_PRESETS = os.getenv("VIDEO_PRESETS", "web.mp4")
+VIDEO_ENCODE_SINGLE_PASS = os.getenv(
+    "VIDEO_ENCODE_SINGLE_PASS", "False"
+).capitalize()
+VIDEO_PROBE = os.getenv("VIDEO_PROBE", "False").capitalize()
+VIDEO_PROBE_CACHE_FILENAME = os.getenv(
+    "VIDEO_PROBE_CACHE_FILENAME", "probe_cache.json"
+)
+VIDEO_PROBE_BITRATE_TOLERANCE = float(
+    os.getenv("VIDEO_PROBE_BITRATE_TOLERANCE", 1.1)
+)
+CLOUD_VIDEO_PRESET = os.getenv("CLOUD_VIDEO_PRESET", "web.mp4")
+MEDIA_STAGING = os.getenv(
+    "MEDIA_STAGING", "copy"
+).lower()  # copy|hardlink|reflink|symlink
 ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", 1))
+ENCODER_JOBS = int(os.getenv("ENCODER_JOBS", 0))  # 0: auto
+ENCODER_THREAD_BUDGET = int(
+    os.getenv("ENCODER_THREAD_BUDGET", 0)
+)  # 0: cpu count
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", 1))
+BUILD_CHUNK_SIZE = int(os.getenv("BUILD_CHUNK_SIZE", 16))
+BUILD_MANIFEST = os.getenv("BUILD_MANIFEST", "True").capitalize()
+BUILD_MANIFEST_FILENAME = os.getenv(
+    "BUILD_MANIFEST_FILENAME", "build_manifest.json"
+)
+BUILD_MANIFEST_HASH = os.getenv("BUILD_MANIFEST_HASH", "False").capitalize()
+MEDIA_TYPE_SNIFF = os.getenv("MEDIA_TYPE_SNIFF", "False").capitalize()
+MEDIA_TS_SOURCE = os.getenv("MEDIA_TS_SOURCE", "folder").lower()
+MEDIA_TS_CACHE_FILENAME = os.getenv("MEDIA_TS_CACHE_FILENAME", "ts_cache.json")
+MEDIA_DEDUP = os.getenv("MEDIA_DEDUP", "False").capitalize()
+MEDIA_DEDUP_WORKERS = int(os.getenv("MEDIA_DEDUP_WORKERS", 4))
+MEDIA_DEDUP_FILENAME = os.getenv("MEDIA_DEDUP_FILENAME", "dedup_index.json")
 ##
 MEDIA_ENCODE_PLATFORM = os.getenv(
     "MEDIA_ENCODE_PLATFORM", "cloud"
 )  # cloud|local
 QUEUE_NAME = os.getenv("QUEUE_NAME", "liamvalentin-video-encode")
 QUEUE_VISIBILITY = os.getenv("QUEUE_VISIBILITY", "900")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "False").capitalize()
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 64))
+PIPELINE_UPLOAD_WORKERS = int(os.getenv("PIPELINE_UPLOAD_WORKERS", 4))
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", 16))
+S3_MAX_POOL_CONNECTIONS = int(
+    os.getenv("S3_MAX_POOL_CONNECTIONS", 0)
+)  # 0: auto
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 8))
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", 8))
+S3_TRANSFER_MAX_CONCURRENCY = int(os.getenv("S3_TRANSFER_MAX_CONCURRENCY", 4))
+S3_SYNC_COMPARE = os.getenv("S3_SYNC_COMPARE", "etag").lower()  # size|etag
+S3_SYNC_DELETE = os.getenv("S3_SYNC_DELETE", "False").capitalize()
+S3_CHECKSUM_CACHE_FILENAME = os.getenv(
+    "S3_CHECKSUM_CACHE_FILENAME", "checksum_cache.json"
+)
+S3_CLEAN_MIN_AGE_HOURS = float(os.getenv("S3_CLEAN_MIN_AGE_HOURS", 24))
+S3_CLEAN_WORKERS = int(os.getenv("S3_CLEAN_WORKERS", 16))
+S3_LIST_WORKERS = int(os.getenv("S3_LIST_WORKERS", 16))
+S3_INVENTORY = os.getenv("S3_INVENTORY", "False").capitalize()
+S3_INVENTORY_FILENAME = os.getenv("S3_INVENTORY_FILENAME", "s3_inventory.json")
+S3_INVENTORY_RECONCILE_HOURS = float(
+    os.getenv("S3_INVENTORY_RECONCILE_HOURS", 168)
+)
+S3_INVENTORY_RELIST_HOURS = float(os.getenv("S3_INVENTORY_RELIST_HOURS", 24))
+S3_RESUMABLE_UPLOAD = os.getenv("S3_RESUMABLE_UPLOAD", "False").capitalize()
+S3_RESUMABLE_THRESHOLD_MB = int(os.getenv("S3_RESUMABLE_THRESHOLD_MB", 256))
+S3_UPLOAD_CHECKPOINT_FILENAME = os.getenv(
+    "S3_UPLOAD_CHECKPOINT_FILENAME", "upload_checkpoints.json"
+)
+S3_UPLOAD_VERIFY = os.getenv("S3_UPLOAD_VERIFY", "False").capitalize()
+S3_CHECKSUM_ALGORITHM = os.getenv(
+    "S3_CHECKSUM_ALGORITHM", "md5"
+).lower()  # md5|crc32|crc32c
+S3_HASH_WORKERS = int(os.getenv("S3_HASH_WORKERS", 4))
+CLOUD_BACKEND = os.getenv(
+    "CLOUD_BACKEND", "threads"
+).lower()  # threads|asyncio
+CLOUD_ASYNC_CONCURRENCY = int(os.getenv("CLOUD_ASYNC_CONCURRENCY", 64))
+S3_UPLOAD_MAX_MB_PER_S = float(
+    os.getenv("S3_UPLOAD_MAX_MB_PER_S", 0)
+)  # 0: unlimited
+S3_UPLOAD_MAX_REQUESTS_PER_S = float(
+    os.getenv("S3_UPLOAD_MAX_REQUESTS_PER_S", 0)
+)  # 0: unlimited
+S3_RETRY_MODE = os.getenv(
+    "S3_RETRY_MODE", "adaptive"
+).lower()  # legacy|standard|adaptive
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 10))
+S3_INVENTORY_REPORT = os.getenv("S3_INVENTORY_REPORT", "")
+S3_INVENTORY_REPORT_PATH = os.getenv(
+    "S3_INVENTORY_REPORT_PATH", f"{FILES_LIST_PATH}/inventory_report"
+)
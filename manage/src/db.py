@@ -6,6 +6,7 @@ from constants import (
     AWS_REGION,
 )
 from init import logger, statistics
+from async_backend import use_asyncio, run, batch_write_async
 
 
 def create_table(
@@ -78,12 +79,15 @@ def seed_db_table(
     )
 
     try:
-        dynamodb = boto3.resource("dynamodb", region_name=aws_region)
-        table = dynamodb.Table(table_name)
+        if use_asyncio():
+            run(batch_write_async(db_objects, table_name, aws_region))
+        else:
+            dynamodb = boto3.resource("dynamodb", region_name=aws_region)
+            table = dynamodb.Table(table_name)
 
-        with table.batch_writer() as batch:
-            for item in db_objects:
-                batch.put_item(Item=item)
+            with table.batch_writer() as batch:
+                for item in db_objects:
+                    batch.put_item(Item=item)
 
         statistics.append(["seed_db_table", len(db_objects)])
 
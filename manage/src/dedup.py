@@ -0,0 +1,114 @@
+import os
+import copy
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from constants import (
+    FILES_LIST_PATH,
+    MEDIA_DEDUP_FILENAME,
+    MEDIA_DEDUP_WORKERS,
+)
+from init import logger
+from helpers import load_json_store, save_json_store, file_hash
+
+
+def hash_files(
+    files: list = None, media_dedup_workers: int = MEDIA_DEDUP_WORKERS
+) -> dict:
+    """ Returns {file: content hash}, files are hashed by chunks over a thread pool """
+
+    with ThreadPoolExecutor(max_workers=media_dedup_workers) as executor:
+        hashes = executor.map(file_hash, files)
+
+        return dict(zip(files, hashes))
+
+
+def find_duplicates(
+    files: list = None, media_dedup_workers: int = MEDIA_DEDUP_WORKERS
+) -> dict:
+    """ Returns {duplicate file: first file with the same content} """
+
+    # only files sharing their size with another one need to be hashed
+    sizes = defaultdict(list)
+    for item in files:
+        sizes[os.path.getsize(item)].append(item)
+    candidates = [
+        item for group in sizes.values() if len(group) > 1 for item in group
+    ]
+
+    if len(candidates) == 0:
+        return {}
+
+    logger.info(f"Hashing {len(candidates)} file(s) sharing their size...")
+    hashes = hash_files(candidates, media_dedup_workers)
+
+    duplicates = {}
+    first_seen = {}
+    for item in files:
+        if item not in hashes:
+            continue
+        key = (os.path.getsize(item), hashes[item])
+        if key in first_seen:
+            duplicates[item] = first_seen[key]
+        else:
+            first_seen[key] = item
+
+    logger.debug(f"{len(duplicates)} duplicate(s) found.")
+
+    return duplicates
+
+
+def load_dedup_index(
+    files_list_path: str = FILES_LIST_PATH,
+    media_dedup_filename: str = MEDIA_DEDUP_FILENAME,
+) -> list:
+    """ Load the duplicates => generated media references """
+
+    return load_json_store(f"{files_list_path}/{media_dedup_filename}").get(
+        "aliases", []
+    )
+
+
+def save_dedup_index(
+    aliases: list = None,
+    files_list_path: str = FILES_LIST_PATH,
+    media_dedup_filename: str = MEDIA_DEDUP_FILENAME,
+) -> bool:
+    """ Save the duplicates => generated media references """
+
+    save_json_store(
+        f"{files_list_path}/{media_dedup_filename}", {"aliases": aliases}
+    )
+    logger.info(
+        f'Deduplication index saved: "{files_list_path}/{media_dedup_filename}".'
+    )
+
+    return True
+
+
+def apply_dedup_aliases(media_list: list = None, aliases: list = None) -> list:
+    """ Reference the media generated once from every date its duplicates belong to """
+
+    if not aliases:
+        return media_list
+
+    by_source = defaultdict(list)
+    for media in media_list:
+        ts = media["path"].split("/")[-1]
+        stem = os.path.splitext(media["name"])[0]
+        by_source[(ts, stem)].append(media)
+
+    data = list(media_list)
+    for alias in aliases:
+        # a copy within the same date is already shown once
+        if alias["ts"] == alias["canonical_ts"]:
+            continue
+        stem = os.path.splitext(alias["canonical_name"])[0]
+        for media in by_source.get((alias["canonical_ts"], stem), []):
+            ts = alias["ts"]
+            media = copy.deepcopy(media)
+            media["ts"] = f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]}"
+            data.append(media)
+
+    logger.debug(f"{len(data) - len(media_list)} media reference(s) added.")
+
+    return sorted(data, key=lambda item: item["ts"])
@@ -1,9 +1,19 @@
-from init import logger, filter_list, statistics
+from init import logger, filter_list, s3_filter_list, statistics
 from datetime import datetime
-from constants import CONFIG_PATH, FILES_LIST_PATH, LOG_LEVEL
+from constants import (
+    CONFIG_PATH,
+    FILES_LIST_PATH,
+    LOG_LEVEL,
+    MEDIA_STAGING,
+    MEDIA_TYPE_SNIFF,
+)
+from media_types import extension_media_type, sniff_media_type, SNIFF_SIZE
 import re
+import os
+import shutil
 import json
 import sys
+import hashlib
 
 if LOG_LEVEL == "DEBUG":
     import traceback
@@ -11,44 +21,52 @@ if LOG_LEVEL == "DEBUG":
 else:
     pass
 
-SUPPORTED_PICTURE_FORMATS = [
-    ".jpg",
-    ".jpeg",
-    ".png",
-    ".gif",
-]
-SUPPORTED_MOVIE_FORMATS = [
-    ".mov",
-    ".m4v",
-    ".mp4",
-    ".MP4",
-    ".ogg",
-    ".mpg",
-    ".mpeg",
-]
+# eg.: "IMG_0001.640w.jpg" is the 640px wide rendition of "IMG_0001.jpg"
+RENDITION_PATTERN = re.compile("^(.+)[.]([0-9]+)w([.][a-z-A-Z-0-9]+)$")
 
 
 def get_media_type(
-    file_name: str = None,
-    supported_pictures_formats: tuple = SUPPORTED_PICTURE_FORMATS,
-    supported_movies_formats: tuple = SUPPORTED_MOVIE_FORMATS,
+    file_name: str = None, media_type_sniff: str = MEDIA_TYPE_SNIFF
 ) -> str:
     """ Returns the media type of the input filename """
 
-    pictures = [(item, item.upper()) for item in supported_pictures_formats]
-    movies = [(item, item.upper()) for item in supported_movies_formats]
+    media_type = extension_media_type(file_name)
 
-    if list(filter(file_name.endswith, pictures)) != []:
-        media_type = "picture"
-    elif list(filter(file_name.endswith, movies)) != []:
-        media_type = "movie"
+    if (
+        media_type is None
+        and media_type_sniff == "True"
+        and os.path.isfile(file_name)
+    ):
+        with open(file_name, "rb") as r:
+            media_type = sniff_media_type(r.read(SNIFF_SIZE))
     else:
+        pass
+
+    if media_type is None:
         media_type = "UNSUPPORTED"
         logger.warning(f"Type unsupported: \"{file_name.split('.')[-1]}\".")
 
     return media_type
 
 
+def rendition_name(file_name: str = None, width: int = None) -> str:
+    """ Returns the file name of the "width" rendition of file_name """
+
+    stem, ext = os.path.splitext(file_name)
+
+    return f"{stem}.{width}w{ext}"
+
+
+def parse_rendition_name(file_name: str = None) -> tuple:
+    """ Returns (original file name, width) of a rendition, else None """
+
+    match = RENDITION_PATTERN.match(file_name)
+    if match:
+        return (f"{match.group(1)}{match.group(3)}", int(match.group(2)))
+    else:
+        return None
+
+
 def media_ts_format(ts: str = None, media: str = None) -> str:
     """ invoked by build_media_files_from_list() - check and format 'ts' """
 
@@ -82,31 +100,118 @@ def media_ts_format(ts: str = None, media: str = None) -> str:
         return False
 
 
+def glob_to_regex(pattern: str = None) -> str:
+    """ Translate a glob ("*", "?", "[...]", "**") to a regex on "/" separated paths """
+
+    regex = ""
+    i = 0
+
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            regex += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    return regex
+
+
+def compile_exclude_matcher(patterns: list = None) -> dict:
+    """ Compile exclude patterns once, see config/exclude_local.txt for the syntax """
+
+    matcher = {
+        "names": set(),
+        "extensions": set(),
+        "dir_names": set(),
+        "name_globs": [],
+        "path_globs": [],
+        "dir_globs": [],
+    }
+    extension_pattern = re.compile("^[*][.][a-z-A-Z-0-9]+$")
+
+    for item in patterns or []:
+        directory = item.endswith("/")
+        item = item.rstrip("/")
+
+        if extension_pattern.match(item) and not directory:
+            # wildcards on extensions are case-insensitive
+            matcher["extensions"].add(item[1:].casefold())
+        elif not re.search("[*?[/]", item):
+            if directory:
+                matcher["dir_names"].add(item)
+            else:
+                matcher["names"].add(item)
+        elif "/" not in item:
+            regex = re.compile(f"^{glob_to_regex(item)}$")
+            if directory:
+                matcher["dir_globs"].append(regex)
+            else:
+                matcher["name_globs"].append(regex)
+        else:
+            # patterns with a "/" are relative to the root of the tree
+            regex = re.compile(f"^{glob_to_regex(item.lstrip('/'))}$")
+            if directory:
+                matcher["dir_globs"].append(regex)
+            else:
+                matcher["path_globs"].append(regex)
+
+    return matcher
+
+
+local_exclude_matcher = compile_exclude_matcher(filter_list)
+s3_exclude_matcher = compile_exclude_matcher(s3_filter_list)
+
+
+def is_excluded(
+    relative_path: str = None,
+    is_dir: bool = False,
+    matcher: dict = local_exclude_matcher,
+) -> bool:
+    """ Returns True if relative_path (file or folder) is excluded by matcher """
+
+    name = relative_path.rsplit("/", 1)[-1]
+
+    if name in matcher["names"]:
+        return True
+    elif is_dir:
+        # an excluded folder prunes its whole subtree
+        return (
+            name in matcher["dir_names"]
+            or any(item.match(name) for item in matcher["name_globs"])
+            or any(item.match(relative_path) for item in matcher["dir_globs"])
+            or any(item.match(name) for item in matcher["dir_globs"])
+            or any(item.match(relative_path) for item in matcher["path_globs"])
+        )
+    elif os.path.splitext(name)[1].casefold() in matcher["extensions"]:
+        return True
+    else:
+        return any(item.match(name) for item in matcher["name_globs"]) or any(
+            item.match(relative_path) for item in matcher["path_globs"]
+        )
+
+
 def is_filtered(
     target: str = None,
-    config_path: str = CONFIG_PATH,
-    filter_list: list = filter_list,
+    matcher: dict = local_exclude_matcher,
 ) -> bool:
-    """ Returns True if target is a valid file format """
-
-    if target and type(target) == str and len(filter_list) > 0:
-        pattern = re.compile("^[*][.][a-z-A-Z-0-9]+$")
-        wildcard_filter = [
-            item.split(".")[-1] for item in filter_list if pattern.match(item)
-        ]
-
-        filename_filter = [
-            item for item in filter_list if not pattern.match(item)
-        ]
-
-        if (
-            target in filename_filter
-            or target.split(".")[-1].lower() in wildcard_filter
-            or target.split(".")[-1].upper() in wildcard_filter
-        ):
-            return True
-        else:
-            return False
+    """ Returns True if target (file name) is excluded by the filter """
+
+    if target and type(target) == str:
+        return is_excluded(target, False, matcher)
     else:
         return False
 
@@ -141,6 +246,115 @@ def export_to_json(
     return True
 
 
+def load_json_store(store_path: str = None) -> dict:
+    """ Load a JSON key/value store from disk, empty if missing or unreadable """
+
+    if not os.path.exists(store_path):
+        return {}
+
+    try:
+        with open(store_path, "r") as r:
+            data = json.load(r)
+    except ValueError as e:
+        logger.warning(f'Ignoring unreadable store "{store_path}": {e}')
+        return {}
+
+    return data
+
+
+def save_json_store(store_path: str = None, data: dict = None) -> bool:
+    """ Atomically write a JSON key/value store to disk """
+
+    assert data is not None
+    assert type(data) == dict
+
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as w:
+            json.dump(data, w)
+        os.replace(tmp_path, store_path)
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    return True
+
+
+def file_signature(file_path: str = None) -> dict:
+    """ Returns the size/mtime signature of a file """
+
+    st = os.stat(file_path)
+
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def file_hash(
+    file_path: str = None,
+    algorithm: str = "sha256",
+    chunk_size: int = 1024 * 1024,
+) -> str:
+    """ Returns the hex digest of a file, read by chunks """
+
+    digest = hashlib.new(algorithm)
+    with open(file_path, "rb") as r:
+        for chunk in iter(lambda: r.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def stage_file(
+    src: str = None, dst: str = None, media_staging: str = MEDIA_STAGING
+) -> str:
+    """ Place src at dst with the staging strategy, falls back to a copy. Returns the strategy used """
+
+    if os.path.lexists(dst):
+        # never write through an existing link to a source file
+        os.remove(dst)
+
+    try:
+        if media_staging == "hardlink":
+            os.link(src, dst)
+        elif media_staging == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+        elif media_staging == "reflink":
+            reflink_file(src, dst)
+        else:
+            media_staging = "copy"
+            shutil.copyfile(src, dst)
+    except OSError as e:
+        # eg.: other volume, no reflink support on this file system
+        logger.debug(f'{media_staging} failed for "{src}" ({e}), copying.')
+        if os.path.lexists(dst):
+            os.remove(dst)
+        media_staging = "copy"
+        shutil.copyfile(src, dst)
+
+    return media_staging
+
+
+def reflink_file(src: str = None, dst: str = None) -> bool:
+    """ Copy-on-write clone of src (Linux FICLONE: btrfs, xfs, ...) """
+
+    import fcntl
+
+    FICLONE = 0x40049409
+
+    with open(src, "rb") as r, open(dst, "wb") as w:
+        fcntl.ioctl(w.fileno(), FICLONE, r.fileno())
+
+    return True
+
+
+def unlink_output(output_file: str = None) -> bool:
+    """ Remove an output before it is rewritten, it may be linked to a source """
+
+    if os.path.lexists(output_file):
+        os.remove(output_file)
+
+    return True
+
+
 # def assert_check(args: dict = None, log_level: str = LOG_LEVEL) -> bool:
 #     """ assert caller function args """
 
@@ -1,5 +1,6 @@
 import os
 import json
+import multiprocessing
 from logger import init_logger
 from PIL import ImageFile
 from constants import (
@@ -33,7 +34,8 @@ else:
 
 logger = init_logger(__name__, testing_mode=testing_mode)
 
-if LOG_CLEAR == "True":
+# worker processes which are not forked import this module again
+if LOG_CLEAR == "True" and multiprocessing.parent_process() is None:
     try:
         for log_file in log_files:
             if os.path.exists(log_file):
@@ -47,18 +49,22 @@ if LOG_CLEAR == "True":
 else:
     pass
 
+
+def read_exclude_list(exclude_list: str = None) -> list:
+    """ Returns the patterns of an exclude file, without comments and blank lines """
+
+    if not os.path.exists(exclude_list):
+        return []
+
+    with open(exclude_list, "r") as r:
+        patterns = [item.strip() for item in r.read().splitlines()]
+
+    return [item for item in patterns if item and not item.startswith("#")]
+
+
 try:
-    exclude_list = f"{CONFIG_PATH}/exclude_local.txt"
-    if os.path.exists(exclude_list):
-        with open(exclude_list, "r") as r:
-            filter_list = r.read().splitlines()
-        filter_list = [
-            item
-            for item in filter_list
-            if not item.startswith("#") or item != "\n"
-        ]
-    else:
-        filter_list = None
+    filter_list = read_exclude_list(f"{CONFIG_PATH}/exclude_local.txt")
+    s3_filter_list = read_exclude_list(f"{CONFIG_PATH}/exclude_s3.txt")
 except Exception as e:
     logger.error(e)
     raise
@@ -0,0 +1,213 @@
+import os
+import time
+from os.path import basename
+from datetime import datetime, timezone
+from constants import (
+    BUCKET_NAME,
+    FILES_LIST_PATH,
+    S3_PREFIX,
+    S3_INVENTORY,
+    S3_INVENTORY_FILENAME,
+    S3_INVENTORY_RECONCILE_HOURS,
+    S3_INVENTORY_RELIST_HOURS,
+    S3_INVENTORY_REPORT,
+    S3_SYNC_COMPARE,
+)
+from init import logger
+from helpers import load_json_store, save_json_store
+from checksums import load_checksum_cache, save_checksum_cache, local_etag
+
+
+def load_inventory(
+    files_list_path: str = FILES_LIST_PATH,
+    s3_inventory_filename: str = S3_INVENTORY_FILENAME,
+) -> dict:
+    """ Load the local inventory of the S3 objects """
+
+    inventory = load_json_store(f"{files_list_path}/{s3_inventory_filename}")
+    logger.debug(
+        f"{len(inventory.get('objects', {}))} object(s) loaded from S3 inventory."
+    )
+
+    return inventory
+
+
+def save_inventory(
+    inventory: dict = None,
+    files_list_path: str = FILES_LIST_PATH,
+    s3_inventory_filename: str = S3_INVENTORY_FILENAME,
+) -> bool:
+    """ Save the local inventory of the S3 objects """
+
+    save_json_store(f"{files_list_path}/{s3_inventory_filename}", inventory)
+    logger.debug(
+        f"{len(inventory.get('objects', {}))} object(s) saved to S3 inventory."
+    )
+
+    return True
+
+
+def new_inventory(
+    bucket_name: str = BUCKET_NAME, s3_prefix: str = S3_PREFIX
+) -> dict:
+    """ Returns an empty inventory, "reconciled_at" is the time of its full listing """
+
+    return {
+        "bucket": bucket_name,
+        "prefix": s3_prefix,
+        "reconciled_at": time.time(),
+        "objects": {},
+    }
+
+
+def inventory_is_stale(
+    inventory: dict = None,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    s3_inventory_reconcile_hours: float = S3_INVENTORY_RECONCILE_HOURS,
+) -> bool:
+    """ Returns True if the inventory has to be rebuilt from a full listing """
+
+    if not inventory or "objects" not in inventory:
+        return True
+    elif (
+        inventory.get("bucket") != bucket_name
+        or inventory.get("prefix") != s3_prefix
+    ):
+        return True
+    else:
+        age = time.time() - inventory.get("reconciled_at", 0)
+        return age > s3_inventory_reconcile_hours * 3600
+
+
+def inventory_object(obj: dict = None) -> dict:
+    """ Returns the inventory entry of a list_objects_v2 "Contents" item """
+
+    return {
+        "size": obj["Size"],
+        "etag": obj["ETag"].strip('"'),
+        "last_modified": obj["LastModified"].isoformat(),
+    }
+
+
+def inventory_partition(key: str = None, s3_prefix: str = S3_PREFIX) -> str:
+    """ Returns the date partition ("prefix/ts/") of key, None for an object directly under s3_prefix """
+
+    name = key[len(s3_prefix) + 1 :]
+    if "/" not in name:
+        return None
+
+    return f"{s3_prefix}/{name.split('/')[0]}/"
+
+
+def inventory_touch(
+    partitions: list = None,
+    s3_inventory: str = S3_INVENTORY,
+    s3_inventory_report: str = S3_INVENTORY_REPORT,
+) -> int:
+    """ Mark partitions written outside of this tool (eg.: cloud encoder) to be listed again, returns their count """
+
+    if s3_inventory != "True" and not s3_inventory_report:
+        return 0
+    elif len(partitions) == 0:
+        return 0
+
+    # kept without objects too: the S3 Inventory report reads them
+    inventory = load_inventory()
+    now = time.time()
+    touched = inventory.setdefault("touched", {})
+    for partition in partitions:
+        touched[partition] = now
+    save_inventory(inventory)
+
+    return len(partitions)
+
+
+def inventory_touched(
+    inventory: dict = None,
+    s3_inventory_relist_hours: float = S3_INVENTORY_RELIST_HOURS,
+) -> list:
+    """ Returns the partitions to list again, forgets the ones touched too long ago """
+
+    since = time.time() - s3_inventory_relist_hours * 3600
+    touched = {
+        partition: touched_at
+        for partition, touched_at in inventory.get("touched", {}).items()
+        if touched_at > since
+    }
+    inventory["touched"] = touched
+
+    return list(touched)
+
+
+# keys uploaded/deleted by this run, whatever the inventory setting
+run_uploads = set()
+run_deletes = set()
+
+
+def inventory_record_uploads(
+    files: list = None,
+    s3_prefix: str = S3_PREFIX,
+    s3_inventory: str = S3_INVENTORY,
+    s3_sync_compare: str = S3_SYNC_COMPARE,
+) -> int:
+    """ Add files uploaded by this run to the inventory, returns their count """
+
+    for media in files:
+        key = f"{s3_prefix}/{media.split('/')[-2]}/{basename(media)}"
+        run_uploads.add(key)
+        run_deletes.discard(key)
+
+    if s3_inventory != "True" or len(files) == 0:
+        return 0
+
+    inventory = load_inventory()
+    if "objects" not in inventory:
+        # never listed yet, the first refresh does a full listing
+        return 0
+
+    checksum_cache = (
+        load_checksum_cache() if s3_sync_compare == "etag" else None
+    )
+    now = datetime.now(timezone.utc).isoformat()
+
+    for media in files:
+        ts, name = media.split("/")[-2:]
+        if checksum_cache is not None:
+            etag = local_etag(media, None, checksum_cache)
+        else:
+            # unknown: only the size is compared until the next listing
+            etag = None
+        inventory["objects"][f"{s3_prefix}/{ts}/{name}"] = {
+            "size": os.path.getsize(media),
+            "etag": etag,
+            "last_modified": now,
+        }
+
+    if checksum_cache is not None:
+        save_checksum_cache(checksum_cache)
+    save_inventory(inventory)
+
+    return len(files)
+
+
+def inventory_remove(
+    keys: list = None, s3_inventory: str = S3_INVENTORY
+) -> int:
+    """ Remove deleted keys from the inventory, returns their count """
+
+    run_deletes.update(keys)
+    run_uploads.difference_update(keys)
+
+    if s3_inventory != "True" or len(keys) == 0:
+        return 0
+
+    inventory = load_inventory()
+    if "objects" not in inventory:
+        return 0
+
+    for key in keys:
+        inventory["objects"].pop(key, None)
+    save_inventory(inventory)
+
+    return len(keys)
@@ -0,0 +1,206 @@
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+from os.path import basename
+from urllib.parse import urlparse, unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from constants import (
+    BUCKET_NAME,
+    S3_INVENTORY_REPORT_PATH,
+    S3_LIST_WORKERS,
+)
+from init import logger
+
+# ORC and Parquet reports need pyarrow (pip install pyarrow), CSV does not
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+try:
+    import pyarrow.orc as orc
+except ImportError:
+    orc = None
+
+# dated folder of a report: <destination prefix>/<bucket>/<config>/<date>/
+REPORT_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}-\d{2}Z$")
+# ORC/Parquet column => CSV field name
+REPORT_COLUMNS = {
+    "key": "Key",
+    "size": "Size",
+    "last_modified_date": "LastModifiedDate",
+    "e_tag": "ETag",
+    "is_latest": "IsLatest",
+    "is_delete_marker": "IsDeleteMarker",
+}
+
+
+def latest_manifest_key(
+    s3=None, bucket_name: str = None, prefix: str = None
+) -> str:
+    """ Returns the manifest key of the most recent report under prefix """
+
+    dates = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket=bucket_name, Prefix=f"{prefix}/", Delimiter="/"
+    ):
+        dates.extend(
+            [
+                item["Prefix"]
+                for item in page.get("CommonPrefixes", [])
+                if REPORT_DATE_PATTERN.match(item["Prefix"].split("/")[-2])
+            ]
+        )
+
+    if len(dates) == 0:
+        raise FileNotFoundError(
+            f"No inventory report found in s3://{bucket_name}/{prefix}/."
+        )
+
+    return f"{max(dates)}manifest.json"
+
+
+def fetch_inventory_report(
+    s3=None,
+    report: str = None,
+    s3_inventory_report_path: str = S3_INVENTORY_REPORT_PATH,
+    s3_list_workers: int = S3_LIST_WORKERS,
+) -> str:
+    """ Download the latest report of s3://bucket/prefix once, returns its local directory """
+
+    url = urlparse(report)
+    bucket_name = url.netloc
+    prefix = url.path.strip("/")
+
+    if prefix.endswith("manifest.json"):
+        manifest_key = prefix
+    else:
+        manifest_key = latest_manifest_key(s3, bucket_name, prefix)
+    report_date = manifest_key.split("/")[-2]
+    directory = f"{s3_inventory_report_path}/{report_date}"
+
+    # the manifest is written last: a directory holding it is complete
+    if os.path.exists(f"{directory}/manifest.json"):
+        logger.info(f"Inventory report {report_date} already downloaded.")
+        return directory
+
+    logger.info(f"Downloading inventory report {report_date}...")
+    manifest = json.loads(
+        s3.get_object(Bucket=bucket_name, Key=manifest_key)["Body"].read()
+    )
+    os.makedirs(f"{directory}/data", exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=s3_list_workers) as executor:
+        downloads = [
+            executor.submit(
+                s3.download_file,
+                bucket_name,
+                item["key"],
+                f"{directory}/data/{basename(item['key'])}",
+            )
+            for item in manifest["files"]
+        ]
+        for download in downloads:
+            download.result()
+
+    with open(f"{directory}/manifest.json", "w") as w:
+        json.dump(manifest, w)
+
+    # older reports are superseded
+    for item in os.listdir(s3_inventory_report_path):
+        if item != report_date and REPORT_DATE_PATTERN.match(item):
+            shutil.rmtree(f"{s3_inventory_report_path}/{item}")
+
+    logger.info(
+        f"...{len(manifest['files'])} data file(s) saved to \"{directory}\"."
+    )
+
+    return directory
+
+
+def read_manifest(
+    directory: str = None, bucket_name: str = BUCKET_NAME
+) -> dict:
+    """ Load the manifest of a local report, it must describe bucket_name """
+
+    with open(f"{directory}/manifest.json", "r") as r:
+        manifest = json.load(r)
+
+    if manifest.get("sourceBucket") != bucket_name:
+        raise ValueError(
+            f'Inventory report of "{manifest.get("sourceBucket")}", not "{bucket_name}".'
+        )
+    elif manifest.get("fileFormat") == "ORC" and orc is None:
+        raise ImportError('ORC inventory reports need "pyarrow".')
+    elif manifest.get("fileFormat") == "Parquet" and parquet is None:
+        raise ImportError('Parquet inventory reports need "pyarrow".')
+    else:
+        pass
+
+    return manifest
+
+
+def report_time(manifest: dict = None) -> float:
+    """ Returns the creation time of a report (epoch seconds) """
+
+    return int(manifest["creationTimestamp"]) / 1000
+
+
+def report_rows(directory: str = None, manifest: dict = None):
+    """ Yields the rows of every data file of a local report, streamed from disk """
+
+    file_format = manifest["fileFormat"]
+    if file_format == "CSV":
+        fields = [item.strip() for item in manifest["fileSchema"].split(",")]
+
+    for item in manifest["files"]:
+        data_file = f"{directory}/data/{basename(item['key'])}"
+
+        if file_format == "CSV":
+            with gzip.open(data_file, "rt", newline="") as r:
+                for row in csv.reader(r):
+                    row = dict(zip(fields, row))
+                    # CSV reports URL-encode the keys
+                    row["Key"] = unquote_plus(row["Key"])
+                    yield row
+        elif file_format == "Parquet":
+            data = parquet.ParquetFile(data_file)
+            columns = [
+                name
+                for name in data.schema_arrow.names
+                if name in REPORT_COLUMNS
+            ]
+            for batch in data.iter_batches(columns=columns):
+                for row in batch.to_pylist():
+                    yield {REPORT_COLUMNS[k]: v for k, v in row.items()}
+        elif file_format == "ORC":
+            data = orc.ORCFile(data_file)
+            columns = [
+                name for name in data.schema.names if name in REPORT_COLUMNS
+            ]
+            for stripe in range(data.nstripes):
+                batch = data.read_stripe(stripe, columns=columns)
+                for row in batch.to_pylist():
+                    yield {REPORT_COLUMNS[k]: v for k, v in row.items()}
+        else:
+            raise ValueError(f'Unknown inventory format "{file_format}".')
+
+
+def report_keys(
+    directory: str = None, manifest: dict = None, prefix: str = ""
+):
+    """ Yields the keys under prefix of the current objects of a local report """
+
+    for row in report_rows(directory, manifest):
+        # versioned buckets: older versions and delete markers are listed too
+        if str(row.get("IsLatest", True)).lower() == "false":
+            continue
+        elif str(row.get("IsDeleteMarker", False)).lower() == "true":
+            continue
+        elif not row["Key"].startswith(prefix):
+            continue
+        else:
+            yield row["Key"]
@@ -7,76 +7,188 @@ from constants import (
     OUTPUT_IMAGE_HEIGHT,
     LOCAL_MEDIA_OUTPUT_PATH,
     LOG_PATH,
+    BUILD_WORKERS,
+    BUILD_CHUNK_SIZE,
+    BUILD_MANIFEST,
+    MEDIA_DEDUP,
+    MEDIA_TS_SOURCE,
 )
-from init import logger, statistics
-from helpers import is_filtered, media_ts_format, get_media_type
-from media_generator import media_generate, video_encoder
+from init import logger, statistics, cloud_video_encoder_list
+from helpers import (
+    is_excluded,
+    local_exclude_matcher,
+    media_ts_format,
+    get_media_type,
+)
+from media_generator import media_generate, schedule_video_encoding
+from manifest import (
+    load_manifest,
+    save_manifest,
+    manifest_settings,
+    media_signature,
+    manifest_is_current,
+    manifest_prune,
+    manifest_replace,
+)
+from dedup import find_duplicates, save_dedup_index
+from timestamps import load_ts_cache, save_ts_cache, media_metadata_ts
+from probe import merge_probe_cache, probe_cache_updates, save_probe_cache
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
 import re
+import time
+import queue
 
+# folders the last walk could not read, their files are not gone
+unreadable_folders = []
 
-def get_local_medias_files(
+# "path/ts/media.ext" with a YYYYMMDD ts folder
+MEDIA_PATH_PATTERN = re.compile("^.*?/[0-9]{8}/.*[.][a-z-A-Z-0-9]+$")
+MEDIA_TS_PATTERN = re.compile("^[0-9]{8}$")
+
+
+def walk_local_medias_files(
+    path: str = LOCAL_MEDIA_PATH,
+    filtered_files: list = None,
+    matcher: dict = local_exclude_matcher,
+):
+    """ Yields os.DirEntry of local media files as the tree is scanned """
+
+    # (folder, path relative to the root) so patterns never see the prefix
+    stack = [(path, "")]
+    del unreadable_folders[:]
+
+    while stack:
+        dirpath, relative_dir = stack.pop()
+        subdirs = []
+        files = []
+
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    relative_path = f"{relative_dir}{entry.name}"
+                    if entry.is_dir():
+                        # same as os.walk(): symlinked folders are not followed
+                        if entry.is_symlink():
+                            pass
+                        elif is_excluded(relative_path, True, matcher):
+                            if filtered_files is not None:
+                                filtered_files.append(entry.path + "/")
+                        else:
+                            subdirs.append((entry.path, relative_path + "/"))
+                    elif is_excluded(relative_path, False, matcher):
+                        if filtered_files is not None:
+                            filtered_files.append(entry.path)
+                    else:
+                        files.append(entry)
+        except OSError as e:
+            # same as os.walk(): an unreadable or vanished folder is skipped
+            logger.error(f'Folder "{dirpath}" skipped: {e}')
+            unreadable_folders.append(f"{dirpath}/")
+            continue
+
+        yield from files
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+def stream_local_medias_files(
     path: str = LOCAL_MEDIA_PATH,
     save_to_disk: bool = True,
     files_list_path: str = FILES_LIST_PATH,
     files_list_filename: str = FILES_LIST_FILENAME,
     config_path: str = CONFIG_PATH,
-) -> list:
-    """ Generates a list of local media files """
+):
+    """ Returns a generator of local media files path (the list is written to disk as they are found), False if path is missing """
 
-    if os.path.exists(path):
-        local_medias = []
-        filtered_files = []
+    if not os.path.exists(path):
+        logger.critical(f'Missing input "path"! Stopping here!')
+        return False
 
-        try:
-            logger.info("Generating list of local files...")
-            for dirpath, _, files in os.walk(path):
-                for filename in files:
-                    fname = os.path.join(dirpath, filename)
-                    if is_filtered(filename):
-                        filtered_files.append(fname)
-                    else:
-                        local_medias.append(fname)
+    return yield_local_medias_files(
+        path, save_to_disk, files_list_path, files_list_filename, config_path
+    )
 
-            if len(local_medias) > 0:
-                statistics.append(
-                    ["get_local_medias_files", len(local_medias)]
-                )
 
-                logger.info("List successfully generated.")
-                logger.debug(f"Count: {len(local_medias)} local files.")
-            else:
-                logger.critical(
-                    f'No files found in source directory: "{path}".'
-                )
-                return False
+def yield_local_medias_files(
+    path: str = LOCAL_MEDIA_PATH,
+    save_to_disk: bool = True,
+    files_list_path: str = FILES_LIST_PATH,
+    files_list_filename: str = FILES_LIST_FILENAME,
+    config_path: str = CONFIG_PATH,
+):
+    """ invoked by stream_local_medias_files() - yields local media files path while writing the list to disk """
 
-            if save_to_disk:
-                logger.info("Writing local files list to disk...")
-                data_to_write = [item + "\n" for item in local_medias]
+    count = 0
+    filtered_files = []
+    w = None
 
-                with open(
-                    f"{files_list_path}/{files_list_filename}", "w"
-                ) as w:
-                    w.writelines(data_to_write)
+    try:
+        logger.info("Generating list of local files...")
+        if save_to_disk:
+            logger.info("Writing local files list to disk...")
+            w = open(f"{files_list_path}/{files_list_filename}", "w")
+
+        for entry in walk_local_medias_files(path, filtered_files):
+            if w:
+                w.write(entry.path + "\n")
+            count += 1
+            yield entry.path
+
+        if count > 0:
+            statistics.append(["get_local_medias_files", count])
+
+            logger.info("List successfully generated.")
+            logger.debug(f"Count: {count} local files.")
+        else:
+            logger.critical(f'No files found in source directory: "{path}".')
 
-                logger.info(
-                    f'The list has been saved successfully: "{files_list_path}/{files_list_filename}".'
-                )
-            else:
-                pass
+        if w:
+            logger.info(
+                f'The list has been saved successfully: "{files_list_path}/{files_list_filename}".'
+            )
+        else:
+            pass
 
-            if len(filtered_files) > 0:
-                logger.info(
-                    f'Number of file(s) excluded by filter specified in "{config_path}/exclude_local.txt": {len(filtered_files)}.'
-                )
-                logger.debug(f"excluded by filter: {filtered_files}")
-            else:
-                pass
-        except Exception as e:
-            logger.error(e)
-            raise
-        return local_medias
+        if len(filtered_files) > 0:
+            logger.info(
+                f'Number of file(s)/folder(s) excluded by filter specified in "{config_path}/exclude_local.txt": {len(filtered_files)}.'
+            )
+            logger.debug(f"excluded by filter: {filtered_files}")
+        else:
+            pass
+    except Exception as e:
+        logger.error(e)
+        raise
+    finally:
+        if w:
+            w.close()
+
+
+def get_local_medias_files(
+    path: str = LOCAL_MEDIA_PATH,
+    save_to_disk: bool = True,
+    files_list_path: str = FILES_LIST_PATH,
+    files_list_filename: str = FILES_LIST_FILENAME,
+    config_path: str = CONFIG_PATH,
+) -> list:
+    """ Generates a list of local media files """
+
+    if os.path.exists(path):
+        local_medias = list(
+            stream_local_medias_files(
+                path=path,
+                save_to_disk=save_to_disk,
+                files_list_path=files_list_path,
+                files_list_filename=files_list_filename,
+                config_path=config_path,
+            )
+        )
+
+        if len(local_medias) > 0:
+            return local_medias
+        else:
+            return False
     else:
         logger.critical(f'Missing input "path"! Stopping here!')
         return False
@@ -88,51 +200,138 @@ def build_media_files_from_list(
     output_image_height: int = OUTPUT_IMAGE_HEIGHT,
     output_path: str = LOCAL_MEDIA_OUTPUT_PATH,
     log_path: str = LOG_PATH,
+    build_workers: int = BUILD_WORKERS,
+    build_chunk_size: int = BUILD_CHUNK_SIZE,
+    build_manifest: str = BUILD_MANIFEST,
+    media_dedup: str = MEDIA_DEDUP,
+    media_ts_source: str = MEDIA_TS_SOURCE,
+    output_queue: queue.Queue = None,
+    current_outputs: list = None,
+    local_media_path: str = LOCAL_MEDIA_PATH,
 ) -> bool:
     """ Generates web friendly resized images and copy other media files """
 
+    if local_files_list is False:
+        # the listing failed and logged why
+        return False
+
     logger.info("Generating web friendly images...")
     processed_files_count = 0
+    skipped_files_count = 0
     unprocessed_files = []
-    path_pattern = re.compile("^.*?/[0-9]{8}/.*[.][a-z-A-Z-0-9]+$")
-    ts_pattern = re.compile("^[0-9]{8}$")
+    timings = {}
+    media_timestamps = {}
+
+    if media_dedup == "True":
+        # duplicates can be anywhere in the tree, the walk has to complete
+        local_files_list = list(local_files_list)
+        duplicates = find_duplicates(local_files_list)
+    else:
+        duplicates = {}
+
+    if build_manifest == "True":
+        manifest = load_manifest()
+    else:
+        manifest = None
+    build_settings = manifest_settings(output_image_width, output_image_height)
+    sources = set()
+
+    if media_ts_source == "metadata":
+        ts_cache = load_ts_cache()
+    else:
+        ts_cache = None
+
+    if build_workers > 1:
+        executor = media_generate_pool(build_workers, output_queue)
+        logger.info(
+            f"Dispatching files to {build_workers} worker process(es)..."
+        )
+    else:
+        executor = None
+    futures = []
+    jobs = []
 
     try:
         for media in local_files_list:
-            ts = media.split("/")[-2]
+            sources.add(media)
 
-            if path_pattern.match(media):
-                media_ts = ts
-            elif not ts_pattern.match(ts):
-                media_ts = media_ts_format(ts, media)
-            else:
-                logger.warning(
-                    f'The file path format should by like eg.: "path/ts/image.jpg".'
-                )
-                logger.critical(
-                    f'Input file path format "{media}" is incorrect! Stopping here!'
-                )
+            media_ts = media_timestamp(media, ts_cache)
+            if media_ts is False:
                 return False
-
-            if not media_ts:
+            elif not media_ts:
                 unprocessed_files.append(media)
                 logger.warning(
                     f"Could not identify the date format. Skipping."
                 )
+                continue
+
+            media_timestamps[media] = media_ts
+            if media_is_duplicate(media, duplicates, media_timestamps):
+                continue
+
+            current, signature = media_is_current(
+                media, manifest, build_settings, current_outputs
+            )
+            if current:
+                skipped_files_count += 1
+                continue
+
+            job = (
+                media,
+                output_path,
+                media_ts,
+                output_image_width,
+                output_image_height,
+                signature,
+                build_settings,
+            )
+            if executor:
+                jobs.append(job)
+                gen = media_generate_dispatch(
+                    executor=executor,
+                    futures=futures,
+                    jobs=jobs,
+                    build_workers=build_workers,
+                    build_chunk_size=build_chunk_size,
+                    processed_files_count=processed_files_count,
+                    unprocessed_files=unprocessed_files,
+                    manifest=manifest,
+                    timings=timings,
+                    output_queue=output_queue,
+                )
+                processed_files_count, unprocessed_files, jobs = gen
             else:
-                gen = media_generate(
-                    media=media,
-                    output_path=output_path,
-                    media_ts=media_ts,
-                    output_image_width=output_image_width,
-                    output_image_height=output_image_height,
+                gen = media_generate_job(
+                    job=job,
                     processed_files_count=processed_files_count,
                     unprocessed_files=unprocessed_files,
+                    manifest=manifest,
+                    timings=timings,
+                    generated_files=[],
+                    output_queue=output_queue,
                 )
-                # processed_files_count = gen[0]
-                # unprocessed_files = gen[1]
                 processed_files_count, unprocessed_files = gen
 
+        if executor:
+            if len(jobs) > 0:
+                futures.append(executor.submit(media_generate_worker, jobs))
+            gen = media_generate_collect(
+                futures=futures,
+                processed_files_count=processed_files_count,
+                unprocessed_files=unprocessed_files,
+                manifest=manifest,
+                timings=timings,
+                output_queue=output_queue,
+            )
+            processed_files_count, unprocessed_files = gen
+
+        if len(sources) == 0 or not os.path.exists(local_media_path):
+            # outputs are only pruned against a source tree that is there
+            logger.critical(
+                f'No source media found in "{local_media_path}", outputs are kept. Stopping here!'
+            )
+            return False
+
         statistics.append(
             ["build_media_files_from_list", processed_files_count]
         )
@@ -140,34 +339,380 @@ def build_media_files_from_list(
             f"{processed_files_count} images have been generated successfully."
         )
 
-        log_file = f"{log_path}/unprocessed_files.log"
+        manifest_report(manifest, sources, skipped_files_count)
+
+        if media_dedup == "True":
+            media_dedup_report(duplicates, media_timestamps, timings)
+
+        save_unprocessed_files(unprocessed_files, log_path)
+    except Exception as e:
+        logger.error(e)
+        raise
+    finally:
+        if executor:
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+        # keep what has been generated so far even if the run is interrupted
+        if manifest is not None:
+            save_manifest(manifest)
+        if ts_cache is not None:
+            save_ts_cache(ts_cache)
+        save_probe_cache()
 
-        if len(unprocessed_files) > 0:
-            up_files = [item + "\n" for item in unprocessed_files]
+    return True
 
-            with open(log_file, "w") as w:
-                w.writelines(up_files)
 
-            logger.warning(f"{len(unprocessed_files)} unprocessed file(s)!")
-            logger.debug(f"Unprocessed file(s): {unprocessed_files}")
-        elif os.path.exists(log_file):
-            with open(log_file, "r+") as t:
-                t.truncate(0)
-        else:
-            pass
+def media_timestamp(media: str = None, ts_cache: dict = None) -> str:
+    """ invoked by build_media_files_from_list() - returns the ts of media, None if unknown, False if its path is incorrect """
 
-        logger.info("Image files tree generation done.")
+    ts = media.split("/")[-2]
 
-        if len(unprocessed_files) > 0:
-            logger.info(
-                f'Some files were not processed, please review the list: "{log_path}/unprocessed_files.log".'
-            )
-        else:
-            pass
+    if ts_cache is not None:
+        media_ts = media_metadata_ts(media, ts_cache)
+    else:
+        media_ts = None
+
+    if media_ts:
+        pass
+    elif MEDIA_PATH_PATTERN.match(media):
+        media_ts = ts
+    elif not MEDIA_TS_PATTERN.match(ts):
+        # not a date folder: the file is skipped, the build goes on
+        media_ts = media_ts_format(ts, media) or None
+    else:
+        logger.warning(
+            f'The file path format should by like eg.: "path/ts/image.jpg".'
+        )
+        logger.critical(
+            f'Input file path format "{media}" is incorrect! Stopping here!'
+        )
+        return False
+
+    return media_ts
+
+
+def media_is_duplicate(
+    media: str = None, duplicates: dict = None, media_timestamps: dict = None
+) -> bool:
+    """ invoked by build_media_files_from_list() - returns True if media is referenced instead of generated """
+
+    if media not in duplicates:
+        return False
+
+    canonical = duplicates[media]
+    # the canonical comes first: its date and type are known by now
+    if canonical in media_timestamps and get_media_type(canonical):
+        logger.debug(f'Duplicate of "{canonical}", skipping: "{media}".')
+        return True
+
+    # the canonical is not generated, this copy is in its place
+    logger.debug(f'"{canonical}" unprocessed, generating "{media}" instead.')
+    del duplicates[media]
+    for item, first in duplicates.items():
+        if first == canonical:
+            duplicates[item] = media
+
+    return False
+
+
+def media_is_current(
+    media: str = None,
+    manifest: dict = None,
+    build_settings: dict = None,
+    current_outputs: list = None,
+) -> tuple:
+    """ invoked by build_media_files_from_list() - returns (outputs of media are up to date, signature of media) """
+
+    if manifest is None:
+        return (False, None)
+
+    signature = media_signature(media)
+    if not manifest_is_current(manifest, media, signature, build_settings):
+        return (False, signature)
+
+    logger.debug(f'Up to date, skipping: "{media}".')
+    # may already be in the bucket: checked after the build
+    if current_outputs is not None:
+        current_outputs.extend(manifest[media]["outputs"])
+
+    return (True, signature)
+
+
+def media_generate_job(
+    job: tuple = None,
+    processed_files_count: int = 0,
+    unprocessed_files: list = None,
+    manifest: dict = None,
+    timings: dict = None,
+    generated_files: list = None,
+    output_queue: queue.Queue = None,
+) -> tuple:
+    """ Runs media_generate() on a job of build_media_files_from_list() and times it """
+
+    (
+        media,
+        output_path,
+        media_ts,
+        output_image_width,
+        output_image_height,
+        signature,
+        build_settings,
+    ) = job
+
+    tic = time.perf_counter()
+    processed_files_count, unprocessed_files = media_generate(
+        media=media,
+        output_path=output_path,
+        media_ts=media_ts,
+        output_image_width=output_image_width,
+        output_image_height=output_image_height,
+        processed_files_count=processed_files_count,
+        unprocessed_files=unprocessed_files,
+        manifest=manifest,
+        signature=signature,
+        build_settings=build_settings,
+        generated_files=generated_files,
+    )
+    timings[media] = time.perf_counter() - tic
+    if output_queue is not None:
+        for output in generated_files:
+            output_queue.put(output)
+
+    return (processed_files_count, unprocessed_files)
+
+
+def manifest_report(
+    manifest: dict = None, sources: set = None, skipped_files_count: int = 0
+) -> int:
+    """ invoked by build_media_files_from_list() - prunes the removed sources, returns their number """
+
+    if manifest is None:
+        return 0
+
+    # sources of unreadable folders keep their outputs
+    sources.update(
+        [
+            media
+            for media in manifest
+            if media.startswith(tuple(unreadable_folders))
+        ]
+    )
+    pruned_files_count = manifest_prune(manifest, sources)
+    statistics.append(["build_manifest_skipped", skipped_files_count])
+    statistics.append(["build_manifest_pruned", pruned_files_count])
+    logger.info(
+        f"{skipped_files_count} file(s) up to date, {pruned_files_count} removed source(s) pruned."
+    )
+
+    return pruned_files_count
+
+
+def save_unprocessed_files(
+    unprocessed_files: list = None, log_path: str = LOG_PATH
+) -> bool:
+    """ invoked by build_media_files_from_list() - logs the files which were not processed """
+
+    log_file = f"{log_path}/unprocessed_files.log"
+
+    if len(unprocessed_files) > 0:
+        up_files = [item + "\n" for item in unprocessed_files]
+
+        with open(log_file, "w") as w:
+            w.writelines(up_files)
+
+        logger.warning(f"{len(unprocessed_files)} unprocessed file(s)!")
+        logger.debug(f"Unprocessed file(s): {unprocessed_files}")
+    elif os.path.exists(log_file):
+        with open(log_file, "r+") as t:
+            t.truncate(0)
+    else:
+        pass
+
+    logger.info("Image files tree generation done.")
+
+    if len(unprocessed_files) > 0:
+        logger.info(
+            f'Some files were not processed, please review the list: "{log_path}/unprocessed_files.log".'
+        )
+    else:
+        pass
+
+    return True
+
+
+def media_generate_worker(jobs: list = None) -> tuple:
+    """ invoked by build_media_files_from_list() - runs media_generate() on a batch in a worker process """
+
+    # the worker owns a copy of these, only return what this batch added
+    del cloud_video_encoder_list[:]
+    manifest = {}
+    timings = {}
+    generated_files = []
+    processed_files_count = 0
+    unprocessed_files = []
+
+    for job in jobs:
+        processed_files_count, unprocessed_files = media_generate_job(
+            job=job,
+            processed_files_count=processed_files_count,
+            unprocessed_files=unprocessed_files,
+            manifest=manifest,
+            timings=timings,
+            generated_files=generated_files,
+        )
+
+    return (
+        processed_files_count,
+        unprocessed_files,
+        list(cloud_video_encoder_list),
+        manifest,
+        timings,
+        generated_files,
+        probe_cache_updates(),
+    )
+
+
+def media_generate_dispatch(
+    executor: ProcessPoolExecutor = None,
+    futures: list = None,
+    jobs: list = None,
+    build_workers: int = BUILD_WORKERS,
+    build_chunk_size: int = BUILD_CHUNK_SIZE,
+    processed_files_count: int = 0,
+    unprocessed_files: list = None,
+    manifest: dict = None,
+    timings: dict = None,
+    output_queue: queue.Queue = None,
+) -> tuple:
+    """ invoked by build_media_files_from_list() - submits full batches, returns (count, unprocessed files, pending jobs) """
+
+    # workers start on the first batch while the walk goes on
+    if len(jobs) >= build_chunk_size:
+        futures.append(executor.submit(media_generate_worker, jobs))
+        jobs = []
+
+    # bounded in-flight batches: merge the oldest before going on
+    if len(futures) >= 2 * build_workers:
+        processed_files_count, unprocessed_files = media_generate_collect(
+            futures=[futures.pop(0)],
+            processed_files_count=processed_files_count,
+            unprocessed_files=unprocessed_files,
+            manifest=manifest,
+            timings=timings,
+            output_queue=output_queue,
+        )
+
+    return (processed_files_count, unprocessed_files, jobs)
+
+
+def media_generate_pool(
+    build_workers: int = BUILD_WORKERS,
+    output_queue: queue.Queue = None,
+) -> ProcessPoolExecutor:
+    """ Returns the process pool used by build_media_files_from_list() """
+
+    methods = multiprocessing.get_all_start_methods()
+    # uploader threads may hold locks when a worker is forked: start the
+    # workers from a clean server process instead
+    if output_queue is not None and "forkserver" in methods:
+        mp_context = multiprocessing.get_context("forkserver")
+    # fork keeps the already initialized logger/config
+    elif output_queue is None and "fork" in methods:
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = None
+
+    return ProcessPoolExecutor(
+        max_workers=build_workers, mp_context=mp_context
+    )
+
+
+def media_generate_collect(
+    futures: list = None,
+    processed_files_count: int = 0,
+    unprocessed_files: list = None,
+    manifest: dict = None,
+    timings: dict = None,
+    output_queue: queue.Queue = None,
+) -> tuple:
+    """ invoked by build_media_files_from_list() - merges the results of worker batches """
+
+    assert futures is not None
+    assert type(futures) == list
+
+    if unprocessed_files is None:
+        unprocessed_files = []
+
+    try:
+        for future in futures:
+            result = future.result()
+            (
+                count,
+                unprocessed,
+                encoder_list,
+                entries,
+                durations,
+                generated_files,
+                probes,
+            ) = result
+            processed_files_count += count
+            unprocessed_files.extend(unprocessed)
+            cloud_video_encoder_list.extend(encoder_list)
+            if manifest is not None:
+                for media, entry in entries.items():
+                    manifest_replace(manifest, media, entry)
+            if timings is not None:
+                timings.update(durations)
+            merge_probe_cache(probes)
+            if output_queue is not None:
+                for output in generated_files:
+                    output_queue.put(output)
     except Exception as e:
         logger.error(e)
         raise
 
+    logger.debug(f"{len(futures)} batch(es) processed by worker processes.")
+
+    return (processed_files_count, unprocessed_files)
+
+
+def media_dedup_report(
+    duplicates: dict = None,
+    media_timestamps: dict = None,
+    timings: dict = None,
+) -> bool:
+    """ invoked by build_media_files_from_list() - saves the duplicates index and what it saved """
+
+    aliases = []
+    saved_bytes = 0
+    saved_seconds = 0.0
+
+    for media, canonical in duplicates.items():
+        if media not in media_timestamps or canonical not in media_timestamps:
+            continue
+        aliases.append(
+            {
+                "ts": media_timestamps[media],
+                "name": os.path.basename(media),
+                "canonical_ts": media_timestamps[canonical],
+                "canonical_name": os.path.basename(canonical),
+            }
+        )
+        # an up to date canonical was not generated: nothing saved this run
+        if canonical in timings:
+            saved_bytes += os.path.getsize(media)
+            saved_seconds += timings[canonical]
+
+    save_dedup_index(aliases)
+
+    statistics.append(["media_dedup_files", len(aliases)])
+    statistics.append(["media_dedup_bytes", saved_bytes])
+    statistics.append(["media_dedup_seconds", round(saved_seconds, 2)])
+    logger.info(
+        f"{len(aliases)} duplicate(s) referenced instead of generated: {saved_bytes} bytes, ~{saved_seconds:0.1f}s saved."
+    )
+
     return True
 
 
@@ -202,10 +747,15 @@ def process_local_movie_medias(
     local_media_output_path: str = LOCAL_MEDIA_OUTPUT_PATH,
     files_list_path: str = FILES_LIST_PATH,
     files_list_filename: str = FILES_LIST_FILENAME,
+    media_ts_source: str = MEDIA_TS_SOURCE,
 ) -> bool:
     """ Get movie files """
 
     logger.info("Starting batch movie encoding...")
+    ts_pattern = re.compile("^[0-9]{8}$")
+    jobs = []
+    ts_cache = load_ts_cache() if media_ts_source == "metadata" else None
+
     try:
         with open(f"{files_list_path}/{files_list_filename}", "r") as r:
             data = r.read().splitlines()
@@ -213,17 +763,38 @@ def process_local_movie_medias(
         for item in data:
             if get_media_type(item) == "movie":
                 ts = item.split("/")[-2]
-                ts = media_ts_format(ts, item)
+                if ts_cache is not None:
+                    media_ts = media_metadata_ts(item, ts_cache)
+                else:
+                    media_ts = None
+
+                if media_ts:
+                    ts = media_ts
+                elif not ts_pattern.match(ts):
+                    ts = media_ts_format(ts, item)
                 logger.debug(ts)
                 if ts:
-                    video_encoder(
-                        media=item, ts=ts, output_path=local_media_output_path
-                    )
+                    jobs.append((item, ts))
             else:
                 pass
+
+        if ts_cache is not None:
+            save_ts_cache(ts_cache)
+
+        done, failed = schedule_video_encoding(
+            jobs=jobs, output_path=local_media_output_path
+        )
+        statistics.append(["process_local_movie_medias", done])
     except Exception as e:
         logger.error(e)
         raise
+    finally:
+        save_probe_cache()
+
+    if len(failed) > 0:
+        logger.warning(f"{len(failed)} movie(s) failed to encode!")
+        logger.debug(f"Failed movie(s): {failed}")
+        return False
 
     logger.info("Encoder done.")
 
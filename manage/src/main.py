@@ -2,7 +2,12 @@ import os
 from tabulate import tabulate
 import time
 from init import logger, statistics, cloud_video_encoder_list
-from constants import LOG_DISPLAY_ENV_VARS, MEDIA_ENCODE_PLATFORM
+from constants import (
+    LOG_DISPLAY_ENV_VARS,
+    MEDIA_ENCODE_PLATFORM,
+    PIPELINE_MODE,
+    MEDIA_DEDUP,
+)
 from s3 import (
     get_s3_files,
     create_s3_bucket,
@@ -15,14 +20,18 @@ from db import create_table, seed_db_table
 from helpers import is_filtered, export_to_json
 from local import (
     get_local_medias_files,
+    stream_local_medias_files,
     build_media_files_from_list,
-    read_list_from_file,
 )
 from media_queue import create_queue, queue_count
 from media_generator import remote_video_encoder, save_defer_encoding
+from dedup import load_dedup_index, apply_dedup_aliases
+from pipeline import start_uploaders, stop_uploaders
 
 
-def main(display_env: str = LOG_DISPLAY_ENV_VARS) -> None:
+def main(
+    display_env: str = LOG_DISPLAY_ENV_VARS, pipeline_mode: str = PIPELINE_MODE
+) -> None:
     """ Fetch, build and store S3 media files into DynamoDB """
 
     if display_env == "True":
@@ -33,9 +42,22 @@ def main(display_env: str = LOG_DISPLAY_ENV_VARS) -> None:
 
     logger.debug("- Start of execution -")
 
-    prepare_local_resources()
-    setup_cloud_resources()
-    hydrate_cloud_resources()
+    if pipeline_mode == "True":
+        setup_cloud_resources()
+        if not run_pipeline():
+            logger.critical(
+                "Local build failed, cloud resources not hydrated."
+            )
+            return
+        hydrate_cloud_resources(copy_medias=False)
+    else:
+        if not prepare_local_resources():
+            logger.critical(
+                "Local build failed, cloud resources not hydrated."
+            )
+            return
+        setup_cloud_resources()
+        hydrate_cloud_resources()
 
     logger.debug("- End of execution -")
     print(tabulate(statistics))
@@ -47,12 +69,37 @@ def main(display_env: str = LOG_DISPLAY_ENV_VARS) -> None:
 
 def prepare_local_resources(
     media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
-) -> None:
-    local_files = get_local_medias_files()
-    build_media_files_from_list(local_files)
+    output_queue=None,
+    current_outputs=None,
+) -> bool:
+    # generation starts on the first file found, while the tree is scanned
+    local_files = stream_local_medias_files()
+    built = build_media_files_from_list(
+        local_files,
+        output_queue=output_queue,
+        current_outputs=current_outputs,
+    )
     if len(cloud_video_encoder_list) > 0 and media_encode_platform == "cloud":
         save_defer_encoding(cloud_video_encoder_list)
 
+    return built
+
+
+def run_pipeline() -> bool:
+    """ Walk, generate and upload at once: files are sent as they are written """
+
+    pipeline = start_uploaders()
+    built = False
+    try:
+        built = prepare_local_resources(
+            output_queue=pipeline["queue"],
+            current_outputs=pipeline["current"],
+        )
+    finally:
+        done = stop_uploaders(pipeline)
+
+    return built and done
+
 
 def setup_cloud_resources() -> None:
     create_s3_bucket()
@@ -63,15 +110,19 @@ def setup_cloud_resources() -> None:
 
 def hydrate_cloud_resources(
     media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
+    copy_medias: bool = True,
+    media_dedup: str = MEDIA_DEDUP,
 ) -> None:
     # media_sync()
-    medias_copy()
+    if copy_medias:
+        medias_copy()
     s3_clean()
     if len(cloud_video_encoder_list) > 0 and media_encode_platform == "cloud":
         remote_video_encoder()
-    get_s3_files()
-    data = read_list_from_file()
+    data = get_s3_files()
     medias = build_media_objects(data)
+    if media_dedup == "True":
+        medias = apply_dedup_aliases(medias, load_dedup_index())
     cards = build_card_objects(medias)
     export_to_json(cards)
     seed_db_table(cards)
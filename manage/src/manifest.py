@@ -0,0 +1,174 @@
+import os
+from constants import (
+    FILES_LIST_PATH,
+    BUILD_MANIFEST_FILENAME,
+    BUILD_MANIFEST_HASH,
+    VIDEO_ENCODE,
+    VIDEO_PRESETS,
+    MEDIA_ENCODE_PLATFORM,
+    IMAGE_RENDITIONS,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+)
+from init import logger
+from helpers import load_json_store, save_json_store, file_signature, file_hash
+
+
+def load_manifest(
+    files_list_path: str = FILES_LIST_PATH,
+    manifest_filename: str = BUILD_MANIFEST_FILENAME,
+) -> dict:
+    """ Load the build manifest (source file => generated outputs) """
+
+    manifest = load_json_store(f"{files_list_path}/{manifest_filename}")
+    logger.debug(f"{len(manifest)} entries loaded from build manifest.")
+
+    return manifest
+
+
+def save_manifest(
+    manifest: dict = None,
+    files_list_path: str = FILES_LIST_PATH,
+    manifest_filename: str = BUILD_MANIFEST_FILENAME,
+) -> bool:
+    """ Save the build manifest to disk """
+
+    save_json_store(f"{files_list_path}/{manifest_filename}", manifest)
+    logger.info(
+        f'Build manifest saved: "{files_list_path}/{manifest_filename}".'
+    )
+
+    return True
+
+
+def manifest_settings(
+    output_image_width: int = None,
+    output_image_height: int = None,
+    video_encode: str = VIDEO_ENCODE,
+    video_presets: str = VIDEO_PRESETS,
+    media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
+    image_renditions: str = IMAGE_RENDITIONS,
+    image_output_format: str = IMAGE_OUTPUT_FORMAT,
+    image_output_quality: int = IMAGE_OUTPUT_QUALITY,
+) -> dict:
+    """ Settings that invalidate every entry of the manifest when changed """
+
+    return {
+        "output_image_width": output_image_width,
+        "output_image_height": output_image_height,
+        "video_encode": str(video_encode),
+        "video_presets": video_presets,
+        "media_encode_platform": media_encode_platform,
+        "image_renditions": image_renditions,
+        "image_output_format": image_output_format,
+        "image_output_quality": image_output_quality,
+    }
+
+
+def media_signature(
+    media: str = None, build_manifest_hash: str = BUILD_MANIFEST_HASH
+) -> dict:
+    """ Returns the size/mtime (and optional content hash) of a source file """
+
+    signature = file_signature(media)
+    if build_manifest_hash == "True":
+        signature["hash"] = file_hash(media)
+
+    return signature
+
+
+def manifest_is_current(
+    manifest: dict = None,
+    media: str = None,
+    signature: dict = None,
+    settings: dict = None,
+) -> bool:
+    """ Returns True if the outputs of media are up to date """
+
+    entry = manifest.get(media)
+    if not entry:
+        return False
+
+    if (
+        entry.get("size") != signature["size"]
+        or entry.get("mtime") != signature["mtime"]
+        or entry.get("hash") != signature.get("hash")
+        or entry.get("settings") != settings
+    ):
+        return False
+
+    outputs = entry.get("outputs", [])
+    return len(outputs) > 0 and all(os.path.exists(item) for item in outputs)
+
+
+def manifest_record(
+    manifest: dict = None,
+    media: str = None,
+    signature: dict = None,
+    settings: dict = None,
+    outputs: list = None,
+) -> bool:
+    """ Record the outputs generated from media """
+
+    entry = dict(signature)
+    entry["settings"] = settings
+    entry["outputs"] = outputs
+    manifest_replace(manifest, media, entry)
+
+    return True
+
+
+def manifest_replace(
+    manifest: dict = None, media: str = None, entry: dict = None
+) -> int:
+    """ Set the entry of media, deletes its previous outputs which are no longer generated; returns their count """
+
+    previous = manifest.get(media, {}).get("outputs", [])
+    # eg.: another IMAGE_OUTPUT_FORMAT or fewer IMAGE_RENDITIONS
+    stale = [item for item in previous if item not in entry["outputs"]]
+
+    try:
+        for output in stale:
+            if os.path.exists(output):
+                os.remove(output)
+                logger.info(f'Removed stale output: "{output}".')
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    manifest[media] = entry
+
+    return len(stale)
+
+
+def manifest_prune(manifest: dict = None, sources: set = None) -> int:
+    """ Delete outputs of sources that no longer exist, returns their count """
+
+    if not sources:
+        # an empty walk is a missing/unmounted source tree, not a deletion
+        logger.warning("No source media, build manifest not pruned.")
+        return 0
+
+    gone = [media for media in manifest if media not in sources]
+    if len(gone) == 0:
+        return 0
+
+    referenced = set()
+    for media in manifest:
+        if media in sources:
+            referenced.update(manifest[media].get("outputs", []))
+
+    try:
+        for media in gone:
+            for output in manifest[media].get("outputs", []):
+                if output not in referenced and os.path.exists(output):
+                    os.remove(output)
+                    logger.info(f'Removed stale output: "{output}".')
+            del manifest[media]
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    logger.debug(f"{len(gone)} source(s) pruned from build manifest.")
+
+    return len(gone)
@@ -1,6 +1,6 @@
 import os
 import re
-import shutil
+import math
 import subprocess
 from constants import (
     VIDEO_ENCODE,
@@ -10,6 +10,16 @@ from constants import (
     S3_PREFIX,
     MEDIA_ENCODE_PLATFORM,
     FILES_LIST_PATH,
+    IMAGE_FAST_DECODE,
+    IMAGE_REDUCING_GAP,
+    IMAGE_RENDITIONS,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    ENCODER_JOBS,
+    ENCODER_THREAD_BUDGET,
+    VIDEO_ENCODE_SINGLE_PASS,
+    VIDEO_PROBE,
+    CLOUD_VIDEO_PRESET,
 )
 from init import (
     logger,
@@ -18,10 +28,44 @@ from init import (
     cloud_video_encoder_list,
 )
 from PIL import Image
-from helpers import get_media_type
-from media_queue import send_to_queue
+from helpers import get_media_type, rendition_name, stage_file, unlink_output
+from media_queue import send_batch_to_queue
+from manifest import manifest_record
+from probe import probe_media, probe_decision
+from inventory import inventory_touch
+from concurrent.futures import ThreadPoolExecutor
 import json
 
+# Pillow save() settings per output format, "extension" None keeps the
+# source file name
+IMAGE_ENCODERS = {
+    "jpeg": {
+        "format": "JPEG",
+        "extension": None,
+        "params": {"quality": "web_high", "dpi": (72, 72)},
+    },
+    "progressive_jpeg": {
+        "format": "JPEG",
+        "extension": None,
+        "params": {
+            "quality": "web_high",
+            "dpi": (72, 72),
+            "progressive": True,
+            "optimize": True,
+        },
+    },
+    "webp": {
+        "format": "WEBP",
+        "extension": ".webp",
+        "params": {"quality": 80, "method": 4},
+    },
+    "avif": {
+        "format": "AVIF",
+        "extension": ".avif",
+        "params": {"quality": 60, "speed": 6},
+    },
+}
+
 
 def media_generate(
     media: str = None,
@@ -35,14 +79,22 @@ def media_generate(
     log_path: str = LOG_PATH,
     s3_prefix: str = S3_PREFIX,
     media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
+    manifest: dict = None,
+    signature: dict = None,
+    build_settings: dict = None,
+    video_probe: str = VIDEO_PROBE,
+    cloud_video_preset: str = CLOUD_VIDEO_PRESET,
+    generated_files: list = None,
 ) -> list:
     """ invoked by build_media_files_from_list() - gemerates media files """
 
     media_name = media.split("/")[-1]
-    media_type = get_media_type(media_name)
+    media_type = get_media_type(media)
+    outputs = []
 
     if not os.path.exists(f"{output_path}/{media_ts}"):
-        os.mkdir(f"{output_path}/{media_ts}")
+        # exist_ok: parallel workers may race on the same date folder
+        os.makedirs(f"{output_path}/{media_ts}", exist_ok=True)
         logger.debug(f'Created directory: "{output_path}/{media_ts}".')
     else:
         pass
@@ -54,17 +106,15 @@ def media_generate(
         image = Image.open(media)
         if image:
             with image as im:
-                im.thumbnail((output_image_width, output_image_height))
-                im.save(
+                generated = picture_generate(
+                    im,
                     f"{output_path}/{media_ts}/{media_name}",
-                    format="JPEG",
-                    quality="web_high",
-                    dpi=(72, 72),
+                    output_image_width,
+                    output_image_height,
                 )
             processed_files_count += 1
-            logger.info(
-                f'Generated media: "{output_path}/{media_ts}/{media_name}".'
-            )
+            outputs.extend(generated)
+            logger.info(f'Generated media: "{generated[0]}".')
         else:
             logger.warning(
                 f'Impossible to open the image file: "{media_name}"! File identified format is : "{media_type}". Skipping it.'
@@ -80,40 +130,216 @@ def media_generate(
                 else:
                     pass
                 video_encoder(media, media_ts, output_path)
-            elif media_encode_platform == "cloud":
-                logger.info(f"Movie type identified, starting copy of file...")
-                shutil.copyfile(
-                    media, f"{output_path}/{media_ts}/{media_name}"
-                )
-                logger.info(
-                    f'File copied successfully: "{media}" => "{output_path}/{media_ts}/{media_name}"'
-                )
-                movie = f"{s3_prefix}/{media_ts}/{media_name}"
-                cloud_video_encoder_list.append(
-                    {"src": movie, "ts": media_ts, "delete_old": True}
-                )
-                logger.info(
-                    f"Added movie '{movie}' to queue for defered remote re-encoding."
+                outputs.extend(
+                    encoder_output_files(media, media_ts, output_path)
                 )
+            elif media_encode_platform == "cloud":
+                if video_probe == "True":
+                    decision = cloud_video_decision(media, cloud_video_preset)
+                else:
+                    decision = "encode"
+
+                if decision == "remux":
+                    output_file = encoder_output_files(
+                        media, media_ts, output_path, cloud_video_preset
+                    )[0]
+                    preset_category, preset_format = cloud_video_preset.split(
+                        "."
+                    )
+                    video_remux(
+                        media,
+                        output_file,
+                        video_preset_data[preset_category][preset_format],
+                    )
+                    outputs.append(output_file)
+                    logger.info(
+                        f'Source streams match "{cloud_video_preset}", remuxed instead of remote re-encoding: "{output_file}".'
+                    )
+                else:
+                    logger.info(
+                        f"Movie type identified, starting copy of file..."
+                    )
+                    staging = stage_file(
+                        media, f"{output_path}/{media_ts}/{media_name}"
+                    )
+                    logger.info(
+                        f'File staged successfully ({staging}): "{media}" => "{output_path}/{media_ts}/{media_name}"'
+                    )
+                    outputs.append(f"{output_path}/{media_ts}/{media_name}")
+
+                if decision == "skip":
+                    logger.info(
+                        f'Source already matches "{cloud_video_preset}", no remote re-encoding needed.'
+                    )
+                elif decision == "encode":
+                    movie = f"{s3_prefix}/{media_ts}/{media_name}"
+                    cloud_video_encoder_list.append(
+                        {"src": movie, "ts": media_ts, "delete_old": True}
+                    )
+                    logger.info(
+                        f"Added movie '{movie}' to queue for defered remote re-encoding."
+                    )
             else:
                 logger.critical(
                     'Wrong or missing value! Valid values for "media_encode_platform": local|cloud'
                 )
         else:
             logger.info(f"Movie type identified, starting copy of file...")
-            shutil.copyfile(media, f"{output_path}/{media_ts}/{media_name}")
+            staging = stage_file(
+                media, f"{output_path}/{media_ts}/{media_name}"
+            )
             logger.info(
-                f'File copied successfully: "{media}" => "{output_path}/{media_ts}/{media_name}"'
+                f'File staged successfully ({staging}): "{media}" => "{output_path}/{media_ts}/{media_name}"'
             )
+            outputs.append(f"{output_path}/{media_ts}/{media_name}")
 
         processed_files_count += 1
     else:
         unprocessed_files.append(media)
         logger.warning(f'Impossible to process file: "{media}". Skipping it.')
 
+    if manifest is not None and signature is not None and len(outputs) > 0:
+        manifest_record(manifest, media, signature, build_settings, outputs)
+    if generated_files is not None:
+        generated_files.extend(outputs)
+
     return (processed_files_count, unprocessed_files)
 
 
+def picture_generate(
+    im: Image.Image = None,
+    output_file: str = None,
+    output_image_width: int = None,
+    output_image_height: int = None,
+    image_fast_decode: str = IMAGE_FAST_DECODE,
+    image_reducing_gap: float = IMAGE_REDUCING_GAP,
+    image_renditions: str = IMAGE_RENDITIONS,
+    image_output_format: str = IMAGE_OUTPUT_FORMAT,
+) -> list:
+    """ Resize an opened picture (and its renditions), returns the written files """
+
+    encoder = image_encoder(image_output_format)
+    if encoder["extension"]:
+        output_file = (
+            f"{os.path.splitext(output_file)[0]}{encoder['extension']}"
+        )
+
+    width, height = im.size
+    targets = [((output_image_width, output_image_height), output_file)]
+
+    for rendition_width in rendition_widths(image_renditions):
+        if rendition_width >= width:
+            logger.debug(
+                f'Source is {width}px wide, skipping {rendition_width}w rendition of "{output_file}".'
+            )
+            continue
+        box = (rendition_width, math.ceil(rendition_width * height / width))
+        targets.append((box, rendition_name(output_file, rendition_width)))
+
+    # largest first, every target is then downscaled from the previous one
+    targets.sort(
+        key=lambda target: min(target[0][0] / width, target[0][1] / height),
+        reverse=True,
+    )
+
+    if image_fast_decode == "True":
+        # JPEG only: let libjpeg DCT-scale (1/2 .. 1/8) to the smallest size
+        # still covering the largest target, before any pixel is decoded
+        im.draft("RGB", targets[0][0])
+        reducing_gap = image_reducing_gap
+    else:
+        reducing_gap = 2.0
+
+    outputs = []
+    frame = im
+    for box, target_file in targets:
+        if frame is not im:
+            frame = frame.copy()
+        frame.thumbnail(box, reducing_gap=reducing_gap)
+        picture_save(frame, target_file, encoder)
+        outputs.append(target_file)
+
+    return outputs
+
+
+def picture_save(
+    frame: Image.Image = None, target=None, encoder: dict = None
+) -> bool:
+    """ Encode a resized picture to a file name or file object """
+
+    if encoder["format"] == "JPEG" and frame.mode not in ("RGB", "L"):
+        frame = frame.convert("RGB")
+
+    frame.save(target, format=encoder["format"], **encoder["params"])
+
+    return True
+
+
+def image_encoder(
+    image_output_format: str = IMAGE_OUTPUT_FORMAT,
+    image_output_quality: int = IMAGE_OUTPUT_QUALITY,
+) -> dict:
+    """ Returns the save() settings of the selected output format """
+
+    if image_output_format not in IMAGE_ENCODERS:
+        logger.warning(
+            f'Unknown image output format "{image_output_format}", using "jpeg". Valid values: {"|".join(IMAGE_ENCODERS)}'
+        )
+        image_output_format = "jpeg"
+    elif not image_format_available(image_output_format):
+        logger.warning(
+            f'No Pillow plugin available for "{image_output_format}", using "jpeg".'
+        )
+        image_output_format = "jpeg"
+
+    encoder = dict(IMAGE_ENCODERS[image_output_format])
+    encoder["params"] = dict(encoder["params"])
+    if image_output_quality > 0:
+        encoder["params"]["quality"] = image_output_quality
+
+    return encoder
+
+
+def image_format_available(image_output_format: str = None) -> bool:
+    """ Returns True if Pillow can write the output format """
+
+    if image_output_format == "avif":
+        try:
+            # registers the AVIF plugin on Pillow builds without libavif
+            import pillow_avif  # noqa: F401
+        except ImportError:
+            pass
+
+    Image.init()
+
+    return IMAGE_ENCODERS[image_output_format]["format"] in Image.SAVE
+
+
+def rendition_widths(image_renditions: str = IMAGE_RENDITIONS) -> list:
+    """ Returns the rendition ladder widths, largest first """
+
+    return sorted(
+        {int(item) for item in image_renditions.split(" ") if item},
+        reverse=True,
+    )
+
+
+def encoder_output_files(
+    media: str = None,
+    ts: str = None,
+    output_path: str = None,
+    media_presets: str = VIDEO_PRESETS,
+) -> list:
+    """ Returns the files video_encoder() writes for media """
+
+    stem = media.split("/")[-1].split(".")[-2]
+
+    return [
+        f"{output_path}/{ts}/{stem}.{media_preset.split('.')[1]}"
+        for media_preset in media_presets.split(" ")
+    ]
+
+
 def save_defer_encoding(
     movies_list: list, files_list_path: str = FILES_LIST_PATH
 ) -> bool:
@@ -143,28 +369,53 @@ def video_encoder(
     video_preset_data: dict = video_preset_data,
     media_presets: str = VIDEO_PRESETS,
     encoder_threads: int = ENCODER_THREADS,
+    log_file: str = None,
+    video_encode_single_pass: str = VIDEO_ENCODE_SINGLE_PASS,
+    video_probe: str = VIDEO_PROBE,
 ) -> bool:
     """ Encode video media based on preset """
 
+    if log_file is None:
+        log_file = f"{log_path}/ffmpeg.log"
+
+    if video_probe == "True":
+        media_presets = video_passthrough(
+            media=media,
+            ts=ts,
+            output_path=output_path,
+            video_preset_data=video_preset_data,
+            media_presets=media_presets,
+            log_file=log_file,
+        )
+        if media_presets == "":
+            return True
+
+    if video_encode_single_pass == "True" and " " in media_presets:
+        results = video_encoder_multi(
+            media=media,
+            ts=ts,
+            output_path=output_path,
+            video_preset_data=video_preset_data,
+            media_presets=media_presets,
+            encoder_threads=encoder_threads,
+            log_file=log_file,
+        )
+        failed = [item for item, success in results.items() if not success]
+        if len(failed) > 0:
+            logger.error(f"ffmpeg failed for output(s): {failed}")
+            raise RuntimeError(f'Encoding failed for "{media}": {failed}')
+        return True
+
     try:
         i = 0
         media_presets = media_presets.split(" ")
 
         for media_preset in media_presets:
-            media_preset = media_preset.split(".")
-            preset_category = media_preset[0]
-            preset_format = media_preset[1]
+            preset_category, preset_format = media_preset.split(".")
             settings = video_preset_data[preset_category][preset_format]
 
             logger.debug(f"Settings: {settings}")
 
-            file_format = settings["format"]
-            vcodec = settings["vcodec"]
-            acodec = settings["acodec"]
-            video_bitrate = settings["video_bitrate"]
-            audio_bitrate = settings["audio_bitrate"]
-            encoder_threads = int(encoder_threads)
-
             i += 1
             logger.info(
                 f'Encoding media "{media}" using preset "{preset_category} -> {preset_format}" ...'
@@ -178,10 +429,12 @@ def video_encoder(
             )
             output_file = f"{output_path}/{ts}/{output_filename}"
 
-            cli_cmd = f"ffmpeg -i '{media}' -f {file_format} -vcodec {vcodec} -acodec {acodec} -vb {video_bitrate} -ab {audio_bitrate} -threads {encoder_threads} -y '{output_file}'"
+            output_args = encoder_output_args(settings, encoder_threads)
+            cli_cmd = f"ffmpeg -i '{media}' {output_args} -y '{output_file}'"
             logger.debug(f"cli command: {cli_cmd}")
+            unlink_output(output_file)
 
-            with open(f"{log_path}/ffmpeg.log", "a") as w:
+            with open(log_file, "a") as w:
                 subprocess.run(
                     cli_cmd,
                     shell=True,
@@ -197,6 +450,257 @@ def video_encoder(
     return True
 
 
+def encoder_output_args(
+    settings: dict = None, encoder_threads: int = ENCODER_THREADS
+) -> str:
+    """ Returns the ffmpeg output options of an encoder preset """
+
+    return (
+        f"-f {settings['format']} -vcodec {settings['vcodec']} -acodec {settings['acodec']} "
+        f"-vb {settings['video_bitrate']} -ab {settings['audio_bitrate']} -threads {int(encoder_threads)}"
+    )
+
+
+def video_encoder_multi(
+    media: str = None,
+    ts: str = None,
+    output_path: str = None,
+    log_path: str = LOG_PATH,
+    video_preset_data: dict = video_preset_data,
+    media_presets: str = VIDEO_PRESETS,
+    encoder_threads: int = ENCODER_THREADS,
+    log_file: str = None,
+) -> dict:
+    """ Encode every preset in one ffmpeg run (single demux/decode), returns {output file: success} """
+
+    if log_file is None:
+        log_file = f"{log_path}/ffmpeg.log"
+
+    outputs = encoder_output_files(media, ts, output_path, media_presets)
+
+    if len(set(outputs)) != len(outputs):
+        logger.warning(
+            f'Presets "{media_presets}" write to the same file, encoding them separately...'
+        )
+        video_encoder(
+            media=media,
+            ts=ts,
+            output_path=output_path,
+            video_preset_data=video_preset_data,
+            media_presets=media_presets,
+            encoder_threads=encoder_threads,
+            log_file=log_file,
+            video_encode_single_pass="False",
+            video_probe="False",
+        )
+        return {output_file: True for output_file in outputs}
+
+    cli_cmd = f"ffmpeg -i '{media}'"
+    for media_preset, output_file in zip(media_presets.split(" "), outputs):
+        preset_category, preset_format = media_preset.split(".")
+        settings = video_preset_data[preset_category][preset_format]
+        output_args = encoder_output_args(settings, encoder_threads)
+        cli_cmd += f" {output_args} -y '{output_file}'"
+
+    logger.info(
+        f'Encoding media "{media}" using presets "{media_presets}" in a single pass...'
+    )
+    logger.debug(f"cli command: {cli_cmd}")
+    for output_file in outputs:
+        unlink_output(output_file)
+
+    try:
+        with open(log_file, "a") as w:
+            proc = subprocess.run(
+                cli_cmd,
+                shell=True,
+                check=False,
+                stdout=w,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    results = {
+        output_file: proc.returncode == 0
+        and os.path.exists(output_file)
+        and os.path.getsize(output_file) > 0
+        for output_file in outputs
+    }
+
+    if proc.returncode != 0:
+        # ffmpeg does not tell which output failed, retry them one by one
+        logger.warning(
+            f'Single pass encoding of "{media}" returned code {proc.returncode}, encoding presets separately...'
+        )
+        for media_preset, output_file in zip(
+            media_presets.split(" "), outputs
+        ):
+            try:
+                video_encoder(
+                    media=media,
+                    ts=ts,
+                    output_path=output_path,
+                    video_preset_data=video_preset_data,
+                    media_presets=media_preset,
+                    encoder_threads=encoder_threads,
+                    log_file=log_file,
+                    video_probe="False",
+                )
+                results[output_file] = True
+            except Exception as e:
+                logger.error(f'Preset "{media_preset}" failed: {e}')
+                results[output_file] = False
+
+    for output_file, success in results.items():
+        if success:
+            logger.info(f'Encoded: "{output_file}".')
+        else:
+            logger.warning(f'Failed: "{output_file}".')
+
+    return results
+
+
+def video_passthrough(
+    media: str = None,
+    ts: str = None,
+    output_path: str = None,
+    video_preset_data: dict = video_preset_data,
+    media_presets: str = VIDEO_PRESETS,
+    log_file: str = None,
+) -> str:
+    """ Copy or remux media for presets it already matches, returns the presets left to encode """
+
+    probe = probe_media(media)
+    outputs = encoder_output_files(media, ts, output_path, media_presets)
+    to_encode = []
+
+    for media_preset, output_file in zip(media_presets.split(" "), outputs):
+        preset_category, preset_format = media_preset.split(".")
+        settings = video_preset_data[preset_category][preset_format]
+        decision = probe_decision(media, probe, settings, preset_format)
+
+        if decision == "skip":
+            logger.info(
+                f'"{media}" already matches preset "{media_preset}", copying it as is.'
+            )
+            stage_file(media, output_file)
+        elif decision == "remux":
+            logger.info(
+                f'"{media}" streams match preset "{media_preset}", remuxing.'
+            )
+            video_remux(media, output_file, settings, log_file)
+        else:
+            to_encode.append(media_preset)
+
+    return " ".join(to_encode)
+
+
+def cloud_video_decision(
+    media: str = None,
+    cloud_video_preset: str = CLOUD_VIDEO_PRESET,
+    video_preset_data: dict = video_preset_data,
+) -> str:
+    """Compare media to the remote encoder preset, returns "skip"|"remux"|"encode" """
+
+    preset_category, preset_format = cloud_video_preset.split(".")
+    settings = video_preset_data[preset_category][preset_format]
+
+    return probe_decision(media, probe_media(media), settings, preset_format)
+
+
+def video_remux(
+    media: str = None,
+    output_file: str = None,
+    settings: dict = None,
+    log_file: str = f"{LOG_PATH}/ffmpeg.log",
+) -> bool:
+    """ Stream-copy media into the preset container, no re-encoding """
+
+    cli_cmd = f"ffmpeg -i '{media}' -map 0:v -map 0:a? -c copy -f {settings['format']} -y '{output_file}'"
+    logger.debug(f"cli command: {cli_cmd}")
+    unlink_output(output_file)
+
+    try:
+        with open(log_file, "a") as w:
+            subprocess.run(
+                cli_cmd,
+                shell=True,
+                check=True,
+                stdout=w,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    return True
+
+
+def schedule_video_encoding(
+    jobs: list = None,
+    output_path: str = None,
+    log_path: str = LOG_PATH,
+    encoder_jobs: int = ENCODER_JOBS,
+    encoder_thread_budget: int = ENCODER_THREAD_BUDGET,
+) -> tuple:
+    """ Run video_encoder() for (media, ts) jobs concurrently, returns (done, failed) """
+
+    assert jobs is not None
+    assert type(jobs) == list
+
+    if len(jobs) == 0:
+        return (0, [])
+
+    if encoder_thread_budget < 1:
+        encoder_thread_budget = os.cpu_count() or 1
+    if encoder_jobs < 1:
+        # ffmpeg encoders scale well up to a few threads, more jobs beyond
+        encoder_jobs = max(1, encoder_thread_budget // 4)
+    encoder_jobs = min(encoder_jobs, len(jobs))
+    threads_per_job = max(1, encoder_thread_budget // encoder_jobs)
+
+    # largest first so the run does not end on a single long encode
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job[0]), reverse=True)
+
+    jobs_log_path = f"{log_path}/ffmpeg"
+    os.makedirs(jobs_log_path, exist_ok=True)
+
+    logger.info(
+        f"Encoding {len(jobs)} movie(s): {encoder_jobs} job(s) x {threads_per_job} thread(s)."
+    )
+    logger.info(f"Per job ffmpeg logs => {jobs_log_path}/")
+
+    done = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=encoder_jobs) as executor:
+        futures = {}
+        for media, ts in jobs:
+            stem = os.path.splitext(os.path.basename(media))[0]
+            future = executor.submit(
+                video_encoder,
+                media=media,
+                ts=ts,
+                output_path=output_path,
+                encoder_threads=threads_per_job,
+                log_file=f"{jobs_log_path}/{ts}_{stem}.log",
+            )
+            futures[future] = media
+
+        for future, media in futures.items():
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                logger.error(f'Encoding failed for "{media}": {e}')
+                failed.append(media)
+
+    return (done, failed)
+
+
 def remote_video_encoder(files_list_path: str = FILES_LIST_PATH) -> bool:
     """ Send movies list to SQS -> lambda/ffmpeg """
 
@@ -206,11 +710,16 @@ def remote_video_encoder(files_list_path: str = FILES_LIST_PATH) -> bool:
     if os.path.exists(data_path):
         try:
             with open(data_path, "r") as r:
-                movies = r.read()
-            for movie in movies:
-                queue_message = send_to_queue(movies)
-                logger.info(f"Re-encoding process launched for '{movie}'.")
-                logger.debug(queue_message)
+                movies = json.load(r)
+            # one task per movie, sent in batches
+            sent = send_batch_to_queue([json.dumps(movie) for movie in movies])
+            logger.info(f"Re-encoding process launched for {sent} movie(s).")
+            # the encoder writes (and deletes) in the partitions of the movies
+            inventory_touch(
+                list(
+                    {f"{movie['src'].rsplit('/', 1)[0]}/" for movie in movies}
+                )
+            )
         except Exception as e:
             logger.error(e)
             raise
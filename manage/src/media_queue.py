@@ -2,6 +2,10 @@ import boto3
 import os
 from constants import QUEUE_NAME, QUEUE_VISIBILITY
 from init import logger
+from async_backend import use_asyncio, run, send_messages_async
+
+# send_message_batch() limit
+SQS_BATCH_SIZE = 10
 
 
 def create_queue(
@@ -65,6 +69,48 @@ def send_to_queue(message: str, queue_name: str = QUEUE_NAME) -> str:
     return response
 
 
+def send_batch_to_queue(
+    messages: list = None, queue_name: str = QUEUE_NAME
+) -> int:
+    """ Send messages to SQS queue in batches, returns the number sent """
+
+    assert messages is not None
+    assert type(messages) == list
+
+    logger.info(f"Sending {len(messages)} task(s) to queue...")
+
+    try:
+        if use_asyncio():
+            sent = run(send_messages_async(messages, queue_name))
+        else:
+            sent = 0
+            sqs = boto3.client("sqs")
+            queues = sqs.list_queues(QueueNamePrefix=queue_name)
+            queue_url = queues["QueueUrls"][0]
+            for i in range(0, len(messages), SQS_BATCH_SIZE):
+                batch = messages[i : i + SQS_BATCH_SIZE]
+                response = sqs.send_message_batch(
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {"Id": str(j), "MessageBody": message}
+                        for j, message in enumerate(batch)
+                    ],
+                )
+                logger.debug(response)
+                for failure in response.get("Failed", []):
+                    logger.error(
+                        f"Message not sent: {batch[int(failure['Id'])]} ({failure.get('Message')})"
+                    )
+                sent += len(response.get("Successful", []))
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    logger.info(f"...{sent} task(s) successfully sent to queue.")
+
+    return sent
+
+
 def queue_count(queue_name: str = QUEUE_NAME) -> int:
     """ Display the number of messages in SQS queue """
 
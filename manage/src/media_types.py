@@ -0,0 +1,63 @@
+"""
+Media type classification shared by manage and the Lambda function.
+
+Standard library only: lambda/media_types.py is a copy of this file, the
+pre-commit hook "media-types-copy" checks that both stay identical.
+"""
+
+PICTURE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif")
+MOVIE_EXTENSIONS = (".mov", ".m4v", ".mp4", ".ogg", ".mpg", ".mpeg")
+
+# case-folded extension => media type
+MEDIA_TYPES = dict(
+    [(item, "picture") for item in PICTURE_EXTENSIONS]
+    + [(item, "movie") for item in MOVIE_EXTENSIONS]
+)
+
+# bytes needed by sniff_media_type()
+SNIFF_SIZE = 12
+# ISO base media brands (offset 8) that are pictures, others are movies
+PICTURE_BRANDS = (b"avif", b"avis", b"heic", b"heix", b"mif1")
+
+
+def extension_media_type(file_name: str = None) -> str:
+    """ Returns "picture"|"movie" from the file extension, None if unknown """
+
+    dot = file_name.rfind(".")
+    if dot <= file_name.rfind("/"):
+        return None
+
+    return MEDIA_TYPES.get(file_name[dot:].lower())
+
+
+def sniff_media_type(header: bytes = None) -> str:
+    """ Returns "picture"|"movie" from the first SNIFF_SIZE bytes of a file, None if unknown """
+
+    if header.startswith((b"\xff\xd8\xff", b"\x89PNG", b"GIF8")):
+        return "picture"
+    elif header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "picture"
+    elif header[4:8] == b"ftyp":
+        if header[8:12] in PICTURE_BRANDS:
+            return "picture"
+        else:
+            return "movie"
+    elif header.startswith(
+        (b"OggS", b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3")
+    ):
+        return "movie"
+    else:
+        return None
+
+
+def media_type(
+    file_name: str = None, header: bytes = None, sniff: bool = False
+) -> str:
+    """ Returns "picture"|"movie" or None, sniffs header only when file_name has no known extension """
+
+    kind = extension_media_type(file_name)
+
+    if kind is None and sniff and header:
+        kind = sniff_media_type(header)
+
+    return kind
@@ -0,0 +1,340 @@
+import io
+import base64
+import os
+import math
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from constants import (
+    FILES_LIST_PATH,
+    S3_UPLOAD_CHECKPOINT_FILENAME,
+    S3_MULTIPART_CHUNKSIZE_MB,
+    S3_TRANSFER_MAX_CONCURRENCY,
+)
+from init import logger
+from helpers import load_json_store, save_json_store, file_signature
+from checksums import cached_checksums
+from throttle import throttled_call
+
+MB = 1024 * 1024
+# S3 limits
+MIN_PART_SIZE = 5 * MB
+MAX_PARTS = 10000
+
+# upload threads of every file share the checkpoint file
+checkpoints_lock = threading.Lock()
+
+
+class MappedPart(io.RawIOBase):
+    """ Read-only file object over a slice of a mmap'd file, parts are never copied as a whole """
+
+    def __init__(self, view: memoryview = None):
+        self.view = view
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self.view) - self.position)
+        buffer[:size] = self.view[self.position : self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset: int = 0, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = len(self.view) + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+
+def load_checkpoints(
+    files_list_path: str = FILES_LIST_PATH,
+    s3_upload_checkpoint_filename: str = S3_UPLOAD_CHECKPOINT_FILENAME,
+) -> dict:
+    """ Load the "bucket/key" => multipart upload state store """
+
+    return load_json_store(
+        f"{files_list_path}/{s3_upload_checkpoint_filename}"
+    )
+
+
+def update_checkpoint(
+    upload: str = None,
+    state: dict = None,
+    files_list_path: str = FILES_LIST_PATH,
+    s3_upload_checkpoint_filename: str = S3_UPLOAD_CHECKPOINT_FILENAME,
+) -> bool:
+    """ Save (or remove when state is None) the state of an upload """
+
+    with checkpoints_lock:
+        checkpoints = load_checkpoints(
+            files_list_path, s3_upload_checkpoint_filename
+        )
+        if state is None:
+            checkpoints.pop(upload, None)
+        else:
+            checkpoints[upload] = state
+        save_json_store(
+            f"{files_list_path}/{s3_upload_checkpoint_filename}", checkpoints
+        )
+
+    return True
+
+
+def checkpointed_upload_ids() -> set:
+    """ Returns the upload IDs that can still be resumed """
+
+    return {item["upload_id"] for item in load_checkpoints().values()}
+
+
+def part_size_for(
+    size: int = None,
+    s3_multipart_chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
+) -> int:
+    """ Returns the part size of a file, within the S3 part size/count limits """
+
+    part_size = max(MIN_PART_SIZE, s3_multipart_chunksize_mb * MB)
+
+    return max(part_size, math.ceil(size / MAX_PARTS / MB) * MB)
+
+
+def resume_state(
+    s3=None,
+    bucket_name: str = None,
+    key: str = None,
+    media_file: str = None,
+) -> dict:
+    """ Returns the checkpointed state of an upload with its parts confirmed by S3, None if it can't be resumed """
+
+    state = load_checkpoints().get(f"{bucket_name}/{key}")
+    if state is None:
+        return None
+
+    signature = file_signature(media_file)
+    if (
+        state["file"] != media_file
+        or state["size"] != signature["size"]
+        or (state["mtime"] != signature["mtime"])
+    ):
+        logger.info(
+            f'"{media_file}" changed since its upload started, restarting.'
+        )
+        abort_upload(s3, bucket_name, key, state["upload_id"])
+        return None
+
+    # S3 is the reference: only keep parts it has, with the expected size
+    parts = {}
+    try:
+        paginator = s3.get_paginator("list_parts")
+        for page in paginator.paginate(
+            Bucket=bucket_name, Key=key, UploadId=state["upload_id"]
+        ):
+            for part in page.get("Parts", []):
+                number = part["PartNumber"]
+                expected = min(
+                    state["part_size"],
+                    state["size"] - (number - 1) * state["part_size"],
+                )
+                if part["Size"] == expected:
+                    parts[str(number)] = part["ETag"]
+    except s3.exceptions.NoSuchUpload:
+        logger.info(f'Upload of "{key}" expired or was aborted, restarting.')
+        update_checkpoint(f"{bucket_name}/{key}", None)
+        return None
+
+    state["parts"] = parts
+
+    return state
+
+
+def abort_upload(
+    s3=None, bucket_name: str = None, key: str = None, upload_id: str = None
+) -> bool:
+    """ Abort an upload and forget its checkpoint """
+
+    try:
+        s3.abort_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id
+        )
+    except s3.exceptions.NoSuchUpload:
+        pass
+    update_checkpoint(f"{bucket_name}/{key}", None)
+
+    return True
+
+
+def resumable_upload(
+    s3=None,
+    media_file: str = None,
+    bucket_name: str = None,
+    key: str = None,
+    s3_transfer_max_concurrency: int = S3_TRANSFER_MAX_CONCURRENCY,
+    checksum_cache: dict = None,
+    algorithm: str = None,
+) -> str:
+    """ Multipart upload of media_file, checkpointed after every part and resumed on the next run. Returns the ETag """
+
+    upload = f"{bucket_name}/{key}"
+    state = resume_state(s3, bucket_name, key, media_file)
+
+    if state is not None and state.get("algorithm") != algorithm:
+        # parts checksums are declared when the upload is created
+        abort_upload(s3, bucket_name, key, state["upload_id"])
+        state = None
+
+    if state is None:
+        signature = file_signature(media_file)
+        extra_args = {}
+        if algorithm:
+            extra_args["ChecksumAlgorithm"] = algorithm.upper()
+        response = s3.create_multipart_upload(
+            Bucket=bucket_name, Key=key, **extra_args
+        )
+        state = dict(
+            signature,
+            file=media_file,
+            part_size=part_size_for(signature["size"]),
+            upload_id=response["UploadId"],
+            algorithm=algorithm,
+            parts={},
+        )
+        update_checkpoint(upload, state)
+    else:
+        logger.info(
+            f'Resuming upload of "{key}": {len(state["parts"])} part(s) already sent.'
+        )
+
+    if checksum_cache is not None:
+        checksums = cached_checksums(
+            media_file, state["part_size"], checksum_cache, algorithm
+        )
+        # a part S3 holds with another content is sent again
+        state["parts"] = {
+            number: etag
+            for number, etag in state["parts"].items()
+            if etag.strip('"') == part_md5_hex(checksums, int(number))
+        }
+    else:
+        checksums = None
+
+    parts_count = max(1, math.ceil(state["size"] / state["part_size"]))
+    missing = [
+        number
+        for number in range(1, parts_count + 1)
+        if str(number) not in state["parts"]
+    ]
+    logger.debug(f'{len(missing)}/{parts_count} part(s) to send for "{key}".')
+
+    with open(media_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        view = memoryview(mapped)
+        bodies = []
+        try:
+            with ThreadPoolExecutor(
+                max_workers=s3_transfer_max_concurrency
+            ) as executor:
+                futures = {}
+                for number in missing:
+                    start = (number - 1) * state["part_size"]
+                    body = MappedPart(view[start : start + state["part_size"]])
+                    bodies.append(body)
+                    futures[
+                        executor.submit(
+                            throttled_call,
+                            len(body),
+                            s3.upload_part,
+                            Bucket=bucket_name,
+                            Key=key,
+                            UploadId=state["upload_id"],
+                            PartNumber=number,
+                            Body=body,
+                            **part_checksum_args(checksums, algorithm, number),
+                        )
+                    ] = number
+
+                failed = []
+                for future in as_completed(futures):
+                    try:
+                        etag = future.result()["ETag"]
+                    except Exception as e:
+                        logger.error(f'Part {futures[future]} of "{key}": {e}')
+                        failed.append(e)
+                        continue
+                    number = futures[future]
+                    if checksums and etag.strip('"') != part_md5_hex(
+                        checksums, number
+                    ):
+                        logger.error(
+                            f'Part {number} of "{key}": ETag {etag} does not match the local MD5.'
+                        )
+                        failed.append(ValueError(f"Part {number} corrupted"))
+                        continue
+                    state["parts"][str(number)] = etag
+                    update_checkpoint(upload, state)
+        finally:
+            # the map can only be closed once no view is left on it
+            for body in bodies:
+                body.view.release()
+            view.release()
+
+    if len(failed) > 0:
+        # sent parts stay checkpointed, the next attempt only sends the others
+        raise failed[0]
+
+    parts = []
+    for number, etag in sorted(
+        state["parts"].items(), key=lambda item: int(item[0])
+    ):
+        part = {"PartNumber": int(number), "ETag": etag}
+        if checksums and algorithm:
+            part[f"Checksum{algorithm.upper()}"] = checksums[algorithm][
+                int(number) - 1
+            ]
+        parts.append(part)
+
+    response = s3.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=state["upload_id"],
+        MultipartUpload={"Parts": parts},
+    )
+    update_checkpoint(upload, None)
+
+    return response["ETag"].strip('"')
+
+
+def part_md5_hex(checksums: dict = None, number: int = None) -> str:
+    """ Returns the hex MD5 (the ETag) of a part from its cached checksums """
+
+    return base64.b64decode(checksums["md5"][number - 1]).hex()
+
+
+def part_checksum_args(
+    checksums: dict = None, algorithm: str = None, number: int = None
+) -> dict:
+    """ Returns the upload_part() arguments S3 verifies the part with """
+
+    if checksums is None:
+        return {}
+
+    extra_args = {"ContentMD5": checksums["md5"][number - 1]}
+    if algorithm:
+        extra_args[f"Checksum{algorithm.upper()}"] = checksums[algorithm][
+            number - 1
+        ]
+
+    return extra_args
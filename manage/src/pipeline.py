@@ -0,0 +1,137 @@
+import queue
+import threading
+from os.path import basename
+from constants import PIPELINE_QUEUE_SIZE, PIPELINE_UPLOAD_WORKERS
+from init import logger, statistics
+from s3 import (
+    media_upload_required,
+    send_to_bucket,
+    sync_plan,
+    list_remote_objects,
+    upload_files,
+)
+from inventory import inventory_record_uploads
+from checksums import load_checksum_cache, save_checksum_cache
+
+
+def upload_worker(
+    output_queue: queue.Queue = None,
+    results: dict = None,
+    checksum_cache: dict = None,
+) -> None:
+    """ invoked by start_uploaders() - uploads output files until a None item is received """
+
+    while True:
+        media = output_queue.get()
+        if media is None:
+            output_queue.task_done()
+            break
+
+        try:
+            if media_upload_required(media):
+                send_to_bucket(
+                    media, media.split("/")[-2], checksum_cache=checksum_cache
+                )
+                key = "uploaded"
+            else:
+                key = "skipped"
+        except Exception as e:
+            # keep consuming, a stalled consumer would block the generation
+            logger.error(e)
+            key = "failed"
+        finally:
+            output_queue.task_done()
+
+        with results["lock"]:
+            results[key].append(media)
+
+
+def start_uploaders(
+    pipeline_queue_size: int = PIPELINE_QUEUE_SIZE,
+    pipeline_upload_workers: int = PIPELINE_UPLOAD_WORKERS,
+) -> dict:
+    """ Start the upload threads, returns the pipeline (queue, threads, results, up to date outputs) """
+
+    output_queue = queue.Queue(maxsize=pipeline_queue_size)
+    checksum_cache = load_checksum_cache()
+    results = {
+        "lock": threading.Lock(),
+        "uploaded": [],
+        "skipped": [],
+        "failed": [],
+    }
+    threads = [
+        threading.Thread(
+            target=upload_worker,
+            args=(output_queue, results, checksum_cache),
+            daemon=True,
+        )
+        for i in range(pipeline_upload_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    logger.info(
+        f"{pipeline_upload_workers} uploader(s) waiting for generated files (queue size: {pipeline_queue_size})..."
+    )
+
+    return {
+        "queue": output_queue,
+        "threads": threads,
+        "results": results,
+        "checksum_cache": checksum_cache,
+        "current": [],
+    }
+
+
+def sync_current_outputs(outputs: list = None) -> dict:
+    """ invoked by stop_uploaders() - uploads the up to date outputs missing or different in the bucket """
+
+    results = {"uploaded": [], "skipped": [], "failed": []}
+    medias = {
+        f"{media.split('/')[-2]}/{basename(media)}": media
+        for media in outputs
+        if media_upload_required(media)
+    }
+    if len(medias) == 0:
+        return results
+
+    # the same delta as medias_copy(): size, then ETag
+    to_upload, unchanged = sync_plan(medias, list_remote_objects())
+    uploaded = upload_files(to_upload)
+    results["uploaded"] = uploaded["uploaded"]
+    results["failed"] = uploaded["failed"]
+    results["skipped"] = unchanged
+
+    return results
+
+
+def stop_uploaders(pipeline: dict = None) -> bool:
+    """ Wait for queued files to be uploaded and stop the upload threads """
+
+    for thread in pipeline["threads"]:
+        pipeline["queue"].put(None)
+    for thread in pipeline["threads"]:
+        thread.join()
+
+    results = pipeline["results"]
+    save_checksum_cache(pipeline["checksum_cache"])
+    inventory_record_uploads(results["uploaded"])
+
+    # outputs the build skipped were not queued
+    if len(pipeline["current"]) > 0:
+        synced = sync_current_outputs(pipeline["current"])
+        for key in ("uploaded", "skipped", "failed"):
+            results[key].extend(synced[key])
+    statistics.append(["pipeline_uploaded", len(results["uploaded"])])
+    statistics.append(["pipeline_upload_failed", len(results["failed"])])
+    logger.info(
+        f"{len(results['uploaded'])} file(s) uploaded, {len(results['skipped'])} skipped."
+    )
+
+    if len(results["failed"]) > 0:
+        logger.warning(f"{len(results['failed'])} upload(s) failed!")
+        logger.debug(f"Failed upload(s): {results['failed']}")
+        return False
+
+    return True
@@ -0,0 +1,195 @@
+import json
+import os
+import subprocess
+import threading
+from constants import (
+    FILES_LIST_PATH,
+    VIDEO_PROBE_CACHE_FILENAME,
+    VIDEO_PROBE_BITRATE_TOLERANCE,
+)
+from init import logger
+from helpers import load_json_store, save_json_store, file_signature
+
+# ffmpeg encoder name => codec name reported by ffprobe
+CODEC_ALIASES = {
+    "h264": "h264",
+    "libx264": "h264",
+    "hevc": "hevc",
+    "libx265": "hevc",
+    "libvpx": "vp8",
+    "libvpx-vp9": "vp9",
+    "aac": "aac",
+    "libvorbis": "vorbis",
+    "libopus": "opus",
+}
+
+
+# read from disk once per process; worker processes hand their new entries
+# back to the build, which saves them once
+probe_cache = {"entries": None, "new": {}}
+probe_cache_lock = threading.Lock()
+
+
+def load_probe_cache(
+    files_list_path: str = FILES_LIST_PATH,
+    probe_cache_filename: str = VIDEO_PROBE_CACHE_FILENAME,
+) -> dict:
+    """ Returns the probe cache of this process, loaded on first use """
+
+    with probe_cache_lock:
+        if probe_cache["entries"] is None:
+            probe_cache["entries"] = load_json_store(
+                f"{files_list_path}/{probe_cache_filename}"
+            )
+
+        return probe_cache["entries"]
+
+
+def merge_probe_cache(entries: dict = None) -> None:
+    """ Add entries probed by a worker process, saved with this process' """
+
+    cache = load_probe_cache()
+    with probe_cache_lock:
+        cache.update(entries)
+        probe_cache["new"].update(entries)
+
+
+def probe_cache_updates() -> dict:
+    """ Returns the entries probed since the last call, and forgets them """
+
+    with probe_cache_lock:
+        entries = probe_cache["new"]
+        probe_cache["new"] = {}
+
+    return entries
+
+
+def save_probe_cache(
+    files_list_path: str = FILES_LIST_PATH,
+    probe_cache_filename: str = VIDEO_PROBE_CACHE_FILENAME,
+) -> bool:
+    """ Write the entries probed by this run to the cache file """
+
+    entries = probe_cache_updates()
+    if len(entries) == 0:
+        return False
+
+    cache_path = f"{files_list_path}/{probe_cache_filename}"
+    with probe_cache_lock:
+        # keep what other runs wrote since it was loaded
+        cache = load_json_store(cache_path)
+        cache.update(entries)
+        save_json_store(cache_path, cache)
+    logger.debug(f"{len(entries)} probe(s) saved to the probe cache.")
+
+    return True
+
+
+def probe_media(
+    media: str = None,
+    files_list_path: str = FILES_LIST_PATH,
+    probe_cache_filename: str = VIDEO_PROBE_CACHE_FILENAME,
+) -> dict:
+    """ Returns container/streams info of a movie, cached by path/size/mtime """
+
+    cache = load_probe_cache(files_list_path, probe_cache_filename)
+    signature = file_signature(media)
+
+    entry = cache.get(media)
+    if (
+        entry
+        and entry["size"] == signature["size"]
+        and entry["mtime"] == signature["mtime"]
+    ):
+        return entry["probe"]
+
+    cli_cmd = f"ffprobe -v quiet -print_format json -show_format -show_streams '{media}'"
+    logger.debug(f"cli command: {cli_cmd}")
+
+    try:
+        proc = subprocess.run(
+            cli_cmd,
+            shell=True,
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        data = json.loads(proc.stdout)
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    media_format = data.get("format", {})
+    probe = {
+        "format_name": media_format.get("format_name", ""),
+        "bit_rate": media_format.get("bit_rate"),
+        "creation_time": media_format.get("tags", {}).get("creation_time"),
+        "streams": [
+            {
+                "codec_type": stream.get("codec_type"),
+                "codec_name": stream.get("codec_name"),
+                "bit_rate": stream.get("bit_rate"),
+            }
+            for stream in data.get("streams", [])
+        ],
+    }
+
+    with probe_cache_lock:
+        cache[media] = dict(signature, probe=probe)
+        probe_cache["new"][media] = cache[media]
+
+    return probe
+
+
+def parse_bitrate(bitrate: str = None) -> int:
+    """Returns bits/s from an ffmpeg bitrate, eg.: "1000K" """
+
+    bitrate = str(bitrate).strip().upper()
+    multipliers = {"K": 1000, "M": 1000 * 1000}
+
+    if bitrate[-1] in multipliers:
+        return int(float(bitrate[:-1]) * multipliers[bitrate[-1]])
+    else:
+        return int(bitrate)
+
+
+def probe_decision(
+    media: str = None,
+    probe: dict = None,
+    settings: dict = None,
+    preset_format: str = None,
+    bitrate_tolerance: float = VIDEO_PROBE_BITRATE_TOLERANCE,
+) -> str:
+    """Compare a probed movie to a preset, returns "skip"|"remux"|"encode" """
+
+    streams = probe["streams"]
+    video = [item for item in streams if item["codec_type"] == "video"]
+    audio = [item for item in streams if item["codec_type"] == "audio"]
+
+    if len(video) != 1 or len(audio) > 1:
+        return "encode"
+
+    vcodec = CODEC_ALIASES.get(settings["vcodec"], settings["vcodec"])
+    acodec = CODEC_ALIASES.get(settings["acodec"], settings["acodec"])
+    if video[0]["codec_name"] != vcodec:
+        return "encode"
+    if len(audio) > 0 and audio[0]["codec_name"] != acodec:
+        return "encode"
+
+    # per stream bitrate when known (mp4), else the whole file's (mkv/webm)
+    source_bitrate = video[0]["bit_rate"] or probe["bit_rate"]
+    target_bitrate = parse_bitrate(settings["video_bitrate"])
+    if (
+        source_bitrate is None
+        or int(source_bitrate) > target_bitrate * bitrate_tolerance
+    ):
+        return "encode"
+
+    extension = os.path.splitext(media)[1].lower()
+    if (
+        settings["format"] in probe["format_name"].split(",")
+        and extension == f".{preset_format}"
+    ):
+        return "skip"
+    else:
+        return "remux"
@@ -1,9 +1,13 @@
 import boto3
 import os
 import re
-import json
-import subprocess
+import time
+import threading
 from os.path import basename
+from datetime import datetime, timedelta, timezone
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from constants import (
     BUCKET_NAME,
     FILES_LIST_PATH,
@@ -11,14 +15,185 @@ from constants import (
     AWS_REGION,
     LOCAL_MEDIA_OUTPUT_PATH,
     S3_PREFIX,
-    LOG_PATH,
-    CONFIG_PATH,
     MEDIA_ENCODE_PLATFORM,
     VIDEO_ENCODE,
+    S3_UPLOAD_WORKERS,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_MULTIPART_THRESHOLD_MB,
+    S3_MULTIPART_CHUNKSIZE_MB,
+    S3_TRANSFER_MAX_CONCURRENCY,
+    S3_SYNC_COMPARE,
+    S3_SYNC_DELETE,
+    S3_CLEAN_MIN_AGE_HOURS,
+    S3_CLEAN_WORKERS,
+    S3_LIST_WORKERS,
+    S3_INVENTORY,
+    S3_RESUMABLE_UPLOAD,
+    S3_RESUMABLE_THRESHOLD_MB,
+    S3_UPLOAD_VERIFY,
+    CLOUD_ASYNC_CONCURRENCY,
+    S3_RETRY_MODE,
+    S3_MAX_ATTEMPTS,
+    S3_INVENTORY_REPORT,
+    CLOUD_VIDEO_PRESET,
 )
 from init import logger, statistics
-from local import get_local_medias_files
-from helpers import get_media_type
+from local import get_local_medias_files, walk_local_medias_files
+from helpers import get_media_type, is_excluded, s3_exclude_matcher
+from checksums import (
+    load_checksum_cache,
+    save_checksum_cache,
+    local_etags,
+    cached_checksums,
+    checksum_algorithm,
+)
+from multipart import (
+    resumable_upload,
+    checkpointed_upload_ids,
+    part_size_for,
+    MB,
+)
+from inventory import (
+    load_inventory,
+    save_inventory,
+    new_inventory,
+    inventory_is_stale,
+    inventory_object,
+    inventory_record_uploads,
+    inventory_remove,
+    inventory_partition,
+    inventory_touched,
+    run_uploads,
+    run_deletes,
+)
+from inventory_report import (
+    fetch_inventory_report,
+    read_manifest,
+    report_keys,
+    report_time,
+)
+from async_backend import (
+    use_asyncio,
+    run,
+    upload_files_async,
+    list_objects_async,
+)
+from throttle import (
+    wait_upload,
+    throttle_callback,
+    upload_throttled_seconds,
+)
+
+# delete_objects() limit
+DELETE_BATCH_SIZE = 1000
+# keys of an inventory report handed over at once
+REPORT_BATCH_SIZE = 10000
+
+# one client per region, shared by every upload thread
+s3_clients = {}
+s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(
+    aws_region: str = AWS_REGION,
+    s3_upload_workers: int = S3_UPLOAD_WORKERS,
+    s3_max_pool_connections: int = S3_MAX_POOL_CONNECTIONS,
+    s3_transfer_max_concurrency: int = S3_TRANSFER_MAX_CONCURRENCY,
+    s3_retry_mode: str = S3_RETRY_MODE,
+    s3_max_attempts: int = S3_MAX_ATTEMPTS,
+):
+    """ Returns the shared S3 client, its connection pool fits the upload threads """
+
+    # client creation is not thread safe, using a client is
+    with s3_clients_lock:
+        if aws_region not in s3_clients:
+            if s3_max_pool_connections > 0:
+                max_pool_connections = s3_max_pool_connections
+            else:
+                max_pool_connections = max(
+                    10, s3_upload_workers + s3_transfer_max_concurrency
+                )
+            s3_clients[aws_region] = boto3.client(
+                "s3",
+                region_name=aws_region,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    # adaptive: throttling responses slow every thread down
+                    retries={
+                        "mode": s3_retry_mode,
+                        "total_max_attempts": s3_max_attempts,
+                    },
+                ),
+            )
+            logger.debug(
+                f"S3 client created ({max_pool_connections} pooled connections)."
+            )
+
+        return s3_clients[aws_region]
+
+
+def transfer_config(
+    s3_multipart_threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+    s3_multipart_chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
+    s3_transfer_max_concurrency: int = S3_TRANSFER_MAX_CONCURRENCY,
+) -> TransferConfig:
+    """ Returns the managed transfer settings of a single file """
+
+    return TransferConfig(
+        multipart_threshold=s3_multipart_threshold_mb * 1024 * 1024,
+        multipart_chunksize=s3_multipart_chunksize_mb * 1024 * 1024,
+        max_concurrency=s3_transfer_max_concurrency,
+    )
+
+
+def verified_upload(
+    s3=None,
+    media_file: str = None,
+    bucket_name: str = None,
+    key: str = None,
+    checksum_cache: dict = None,
+    s3_multipart_threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+) -> bool:
+    """ Upload with the local checksums for S3 to verify, then compare the returned ETag """
+
+    algorithm = checksum_algorithm()
+    size = os.path.getsize(media_file)
+
+    if size < s3_multipart_threshold_mb * MB:
+        checksums = cached_checksums(media_file, 0, checksum_cache, algorithm)
+        extra_args = {"ContentMD5": checksums["md5"][0]}
+        if algorithm:
+            extra_args["ChecksumAlgorithm"] = algorithm.upper()
+            extra_args[f"Checksum{algorithm.upper()}"] = checksums[algorithm][
+                0
+            ]
+        wait_upload(size)
+        with open(media_file, "rb") as data:
+            response = s3.put_object(
+                Bucket=bucket_name, Key=key, Body=data, **extra_args
+            )
+        etag = response["ETag"].strip('"')
+    else:
+        # multipart, every part is verified on the way
+        etag = resumable_upload(
+            s3,
+            media_file,
+            bucket_name,
+            key,
+            checksum_cache=checksum_cache,
+            algorithm=algorithm,
+        )
+        checksums = cached_checksums(
+            media_file, part_size_for(size), checksum_cache, algorithm
+        )
+
+    if etag != checksums["etag"]:
+        raise ValueError(
+            f'Integrity check failed for "{key}": S3 ETag {etag}, local {checksums["etag"]}.'
+        )
+    logger.debug(f'Integrity verified for "{key}": {etag}.')
+
+    return True
 
 
 def send_to_bucket(
@@ -27,6 +202,12 @@ def send_to_bucket(
     bucket_name: str = BUCKET_NAME,
     s3_prefix: str = S3_PREFIX,
     aws_region: str = AWS_REGION,
+    s3_resumable_upload: str = S3_RESUMABLE_UPLOAD,
+    s3_resumable_threshold_mb: int = S3_RESUMABLE_THRESHOLD_MB,
+    s3_upload_verify: str = S3_UPLOAD_VERIFY,
+    checksum_cache: dict = None,
+    s3_multipart_threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+    s3_multipart_chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
 ) -> bool:
     """ Send file to S3 """
 
@@ -34,9 +215,36 @@ def send_to_bucket(
 
     try:
         key = f"{s3_prefix}/{ts}/{basename(media_file)}"
-        s3 = boto3.client("s3", region_name=aws_region)
-        with open(media_file, "rb") as data:
-            s3.upload_fileobj(data, bucket_name, key)
+        s3 = get_s3_client(aws_region)
+        if s3_upload_verify == "True":
+            verified_upload(
+                s3,
+                media_file,
+                bucket_name,
+                key,
+                {} if checksum_cache is None else checksum_cache,
+            )
+        elif (
+            s3_resumable_upload == "True"
+            and os.path.getsize(media_file) >= s3_resumable_threshold_mb * MB
+        ):
+            resumable_upload(s3, media_file, bucket_name, key)
+        else:
+            size = os.path.getsize(media_file)
+            if size >= s3_multipart_threshold_mb * MB:
+                # create, parts and complete
+                wait_upload(
+                    0, -(-size // (s3_multipart_chunksize_mb * MB)) + 2
+                )
+            else:
+                wait_upload(0)
+            s3.upload_file(
+                media_file,
+                bucket_name,
+                key,
+                Config=transfer_config(),
+                Callback=throttle_callback,
+            )
         logger.debug(f"media_file: {media_file} - key: {key}")
     except Exception as e:
         logger.error(e)
@@ -54,6 +262,9 @@ def get_s3_files(
     files_list_filename: str = FILES_LIST_FILENAME,
     aws_region: str = AWS_REGION,
     s3_prefix: str = S3_PREFIX,
+    s3_list_workers: int = S3_LIST_WORKERS,
+    s3_inventory: str = S3_INVENTORY,
+    s3_inventory_report: str = S3_INVENTORY_REPORT,
 ) -> list:
     """ Get S3 objects and creates list """
 
@@ -63,6 +274,7 @@ def get_s3_files(
     )
 
     data = []
+    w = None
 
     # testing format: assets/20160823/img.jpg
     pattern = re.compile(
@@ -70,17 +282,42 @@ def get_s3_files(
     )
 
     try:
-        s3 = boto3.client("s3", region_name=aws_region)
-        paginator = s3.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=bucket_name, Prefix=s3_prefix)
-
-        for page in pages:
-            for obj in page["Contents"]:
-                if pattern.match(obj["Key"]):
-                    data.append(obj["Key"])
+        if s3_inventory_report != "":
+            batches = inventory_report_batches(
+                s3_inventory_report, bucket_name, s3_prefix, aws_region
+            )
+        elif s3_inventory == "True":
+            batches = [sorted(refresh_inventory()["objects"])]
+        elif use_asyncio():
+            batches = [
+                [obj["Key"] for obj in batch]
+                for batch in run(
+                    list_objects_async(
+                        bucket_name, f"{s3_prefix}/", aws_region
+                    )
+                )
+            ]
+        else:
+            batches = (
+                [obj["Key"] for obj in batch]
+                for batch in list_objects_parallel(
+                    bucket_name, f"{s3_prefix}/", aws_region, s3_list_workers
+                )
+            )
+
+        if save_to_disk:
+            logger.info("Writing media list to disk...")
+            w = open(f"{files_list_path}/{files_list_filename}", "w")
+
+        for batch in batches:
+            for key in batch:
+                if pattern.match(key):
+                    data.append(key)
+                    if w:
+                        w.write(f"{key}\n")
                 else:
                     logger.warning(
-                        f'Wrong filename format, object "{obj["Key"]}", not added to the list.'
+                        f'Wrong filename format, object "{key}", not added to the list.'
                     )
 
         statistics.append(["get_s3_files", len(data)])
@@ -88,11 +325,7 @@ def get_s3_files(
         logger.info("Media Objects list generated successfully.")
         logger.debug(f"Media objects count: {len(data)}.")
 
-        if save_to_disk:
-            logger.info("Writing media list to disk...")
-            export_data = [f"{item}\n" for item in data]
-            with open(f"{files_list_path}/{files_list_filename}", "w") as w:
-                w.writelines(export_data)
+        if w:
             logger.info(
                 f'List successfully saved to disk: "{files_list_path}/{files_list_filename}".'
             )
@@ -101,10 +334,227 @@ def get_s3_files(
     except Exception as e:
         logger.error(e)
         raise
+    finally:
+        if w:
+            w.close()
 
     return data
 
 
+def list_objects_parallel(
+    bucket_name: str = BUCKET_NAME,
+    prefix: str = None,
+    aws_region: str = AWS_REGION,
+    s3_list_workers: int = S3_LIST_WORKERS,
+):
+    """ Yields batches of objects under prefix: its direct objects, then each partition as its listing completes """
+
+    if use_asyncio():
+        yield from run(list_objects_async(bucket_name, prefix, aws_region))
+        return
+
+    s3 = get_s3_client(aws_region)
+    partitions, objects = list_partitions(s3, bucket_name, prefix)
+    logger.debug(
+        f"{len(partitions)} partition(s) to list with {s3_list_workers} thread(s)."
+    )
+    yield objects
+
+    with ThreadPoolExecutor(max_workers=s3_list_workers) as executor:
+        futures = [
+            executor.submit(list_partition_objects, s3, bucket_name, item)
+            for item in partitions
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def list_partitions(
+    s3=None, bucket_name: str = None, prefix: str = None
+) -> tuple:
+    """ Returns (sub-prefixes, objects) found directly under prefix """
+
+    partitions = []
+    objects = []
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(
+        Bucket=bucket_name, Prefix=prefix, Delimiter="/"
+    ):
+        partitions.extend(
+            [item["Prefix"] for item in page.get("CommonPrefixes", [])]
+        )
+        objects.extend(page.get("Contents", []))
+
+    return (partitions, objects)
+
+
+def list_partition_objects(
+    s3=None, bucket_name: str = None, prefix: str = None, start_after: str = ""
+) -> list:
+    """ Returns every object under prefix (after start_after) """
+
+    objects = []
+    paginator = s3.get_paginator("list_objects_v2")
+
+    # a page without "Contents" is an empty prefix, not an error
+    for page in paginator.paginate(
+        Bucket=bucket_name, Prefix=prefix, StartAfter=start_after
+    ):
+        objects.extend(page.get("Contents", []))
+
+    return objects
+
+
+def inventory_report_batches(
+    report: str = None,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+    s3_list_workers: int = S3_LIST_WORKERS,
+):
+    """ Yields batches of keys under s3_prefix: S3 Inventory report, then the objects added since """
+
+    s3 = get_s3_client(aws_region)
+    if report.startswith("s3://"):
+        directory = fetch_inventory_report(s3, report)
+    else:
+        directory = report
+    manifest = read_manifest(directory, bucket_name)
+
+    # this run's uploads may land before the cursor, in older partitions
+    delta = set(run_uploads)
+    cursor = ""
+    count = 0
+    batch = []
+    # the cloud encoder writes and deletes in older partitions too: they are
+    # listed again instead of read from the report
+    touched = tuple(
+        item
+        for item in inventory_touched(load_inventory())
+        if item.startswith(f"{s3_prefix}/")
+    )
+
+    for key in report_keys(directory, manifest, f"{s3_prefix}/"):
+        if key in run_deletes or key.startswith(touched):
+            continue
+        delta.discard(key)
+        cursor = max(cursor, key)
+        batch.append(key)
+        if len(batch) == REPORT_BATCH_SIZE:
+            count += len(batch)
+            yield batch
+            batch = []
+    count += len(batch)
+    yield batch
+
+    # date partitions sort after each other: keys after the last reported one
+    # were added since the report
+    objects = list_partition_objects(
+        s3, bucket_name, f"{s3_prefix}/", start_after=cursor
+    )
+    delta.update([obj["Key"] for obj in objects])
+    with ThreadPoolExecutor(max_workers=s3_list_workers) as executor:
+        futures = [
+            executor.submit(list_partition_objects, s3, bucket_name, item)
+            for item in touched
+        ]
+        for future in as_completed(futures):
+            delta.update([obj["Key"] for obj in future.result()])
+    delta.difference_update(run_deletes)
+
+    statistics.append(["inventory_report_objects", count])
+    statistics.append(["inventory_report_delta", len(delta)])
+    statistics.append(["inventory_report_relisted", len(touched)])
+    logger.info(
+        f"{count} object(s) read from the inventory report of {datetime.fromtimestamp(report_time(manifest), timezone.utc).isoformat()}, {len(delta)} added since or in {len(touched)} touched partition(s)."
+    )
+
+    yield sorted(delta)
+
+
+def refresh_inventory(
+    full: bool = False,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+) -> dict:
+    """ Bring the local S3 inventory up to date, full listing when stale """
+
+    inventory = load_inventory()
+
+    if full or inventory_is_stale(inventory, bucket_name, s3_prefix):
+        logger.info("Full listing of S3 objects to rebuild the inventory...")
+        touched = inventory.get("touched", {})
+        inventory = new_inventory(bucket_name, s3_prefix)
+        # the cloud encoder may still write to them after this listing
+        inventory["touched"] = touched
+        for batch in list_objects_parallel(
+            bucket_name, f"{s3_prefix}/", aws_region
+        ):
+            for obj in batch:
+                inventory["objects"][obj["Key"]] = inventory_object(obj)
+        statistics.append(
+            ["s3_inventory_reconciled", len(inventory["objects"])]
+        )
+    else:
+        relist_partitions(inventory, bucket_name, s3_prefix, aws_region)
+
+    save_inventory(inventory)
+
+    return inventory
+
+
+def relist_partitions(
+    inventory: dict = None,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+    s3_list_workers: int = S3_LIST_WORKERS,
+) -> int:
+    """ invoked by refresh_inventory() - lists the new, removed and touched partitions again, returns their count """
+
+    s3 = get_s3_client(aws_region)
+    partitions, objects = list_partitions(s3, bucket_name, f"{s3_prefix}/")
+
+    known = {}
+    for key in inventory["objects"]:
+        known.setdefault(inventory_partition(key, s3_prefix), []).append(key)
+
+    # keys are not listed in date order: a write or a delete may land in any
+    # partition, only the ones this tool knows about are listed again
+    removed = [item for item in known if item and item not in partitions]
+    relist = set(partitions).difference(known)
+    relist.update(
+        [item for item in inventory_touched(inventory) if item in partitions]
+    )
+
+    for partition in removed + list(relist) + [None]:
+        for key in known.get(partition, []):
+            inventory["objects"].pop(key)
+
+    # objects directly under s3_prefix come with the partitions
+    for obj in objects:
+        inventory["objects"][obj["Key"]] = inventory_object(obj)
+
+    with ThreadPoolExecutor(max_workers=s3_list_workers) as executor:
+        futures = [
+            executor.submit(list_partition_objects, s3, bucket_name, item)
+            for item in relist
+        ]
+        for future in as_completed(futures):
+            for obj in future.result():
+                inventory["objects"][obj["Key"]] = inventory_object(obj)
+
+    statistics.append(["s3_inventory_relisted", len(relist)])
+    statistics.append(["s3_inventory_removed", len(removed)])
+    logger.info(
+        f'{len(relist)} new or touched partition(s) listed, {len(removed)} removed, {len(inventory["objects"])} object(s) in inventory.'
+    )
+
+    return len(relist) + len(removed)
+
+
 def create_s3_bucket(
     bucket_name: str = BUCKET_NAME, aws_region: str = AWS_REGION
 ) -> bool:
@@ -154,129 +604,163 @@ def media_sync(
     local_path: str = LOCAL_MEDIA_OUTPUT_PATH,
     bucket_name: str = BUCKET_NAME,
     remote_path_prefix: str = S3_PREFIX,
-    log_path: str = LOG_PATH,
     aws_region: str = AWS_REGION,
-    config_path: str = CONFIG_PATH,
+    s3_sync_delete: str = S3_SYNC_DELETE,
 ) -> bool:
     """ Synchronize local/S3 media files tree """
 
-    exclude_s3_file_path = f"{config_path}/exclude_s3.txt"
-    if os.path.exists(exclude_s3_file_path):
-        with open(exclude_s3_file_path, "r") as r:
-            common_oses_filter = r.read().splitlines()
-        cli_filter_args = ""
-        cli_filter_args = cli_filter_args.join(
-            [
-                f' --exclude "{item}"'
-                for item in common_oses_filter
-                if not item.startswith("#") or item != "\n"
-            ]
-        )
-    else:
-        cli_filter_args = ""
-
     logger.info("Starting sync...")
-    logger.info(f"S3 sync task log => tail -F {log_path}/s3_sync.log")
 
     try:
-        cli_cmd = f"aws s3 sync {local_path}/ s3://{bucket_name}/{remote_path_prefix}/ --delete --region {aws_region} {cli_filter_args}"
-        logger.debug(f"cli command: {cli_cmd}")
-        with open(f"{log_path}/s3_sync.log", "w") as w:
-            proc = subprocess.run(
-                cli_cmd,
-                shell=True,
-                check=True,
-                stdout=w,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-            )
-
-        if proc.returncode == 0:
-            with open(f"{log_path}/s3_sync.log", "r") as r:
-                processed_objects = r.read().splitlines()
-
-            processed_objects = [
-                item for item in processed_objects if "upload" in item
-            ]
-            statistics.append(["media_sync", len(processed_objects)])
-
-            logger.info("Sync completed successfully.")
-            logger.debug(
-                f"{len(processed_objects)} files have been synchronized successfully."
-            )
-            logger.debug(f"S3 CLI returned code: {proc.returncode} => OK")
-        else:
-            logger.critical("Something wrong happened during sync operation!")
-            return False
+        counts = delta_sync(
+            local_path=local_path,
+            bucket_name=bucket_name,
+            s3_prefix=remote_path_prefix,
+            aws_region=aws_region,
+            s3_sync_delete=s3_sync_delete,
+        )
     except Exception as e:
         logger.error(e)
         raise
 
+    statistics.append(["media_sync", counts["uploaded"]])
+    statistics.append(["media_sync_unchanged", counts["unchanged"]])
+    statistics.append(["media_sync_deleted", counts["deleted"]])
+    statistics.append(["media_sync_excluded", counts["excluded"]])
+    logger.debug(f"Sync counts: {counts}")
+
+    if counts["failed"] > 0:
+        logger.critical(
+            f"{counts['failed']} object(s) could not be synchronized!"
+        )
+        return False
+
+    logger.info("Sync completed successfully.")
+
     return True
 
 
 def s3_clean(
-    bucket_name: str = BUCKET_NAME, aws_region: str = AWS_REGION
+    bucket_name: str = BUCKET_NAME,
+    aws_region: str = AWS_REGION,
+    s3_clean_min_age_hours: float = S3_CLEAN_MIN_AGE_HOURS,
+    s3_clean_workers: int = S3_CLEAN_WORKERS,
 ) -> bool:
     """ Delete imcomplete multi-part uploads """
 
     logger.info("Getting list of incomplete uploads...")
+    s3 = get_s3_client(aws_region)
+    # uploads started after this may belong to a run still in progress
+    limit = datetime.now(timezone.utc) - timedelta(
+        hours=s3_clean_min_age_hours
+    )
+    multipart_uploads_list = []
+    recent_uploads_count = 0
+    # uploads the next run can resume are not garbage
+    resumable_ids = checkpointed_upload_ids()
+
     try:
-        multipart_uploads_cmd = f"aws s3api list-multipart-uploads --bucket {bucket_name} --region {aws_region}"
-        proc = subprocess.run(
-            multipart_uploads_cmd,
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
+        paginator = s3.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=bucket_name):
+            for item in page.get("Uploads", []):
+                if item["UploadId"] in resumable_ids:
+                    recent_uploads_count += 1
+                elif item["Initiated"] < limit:
+                    multipart_uploads_list.append(item)
+                else:
+                    recent_uploads_count += 1
+    except s3.exceptions.NoSuchBucket:
+        logger.warning(f"Bucket {bucket_name} does not exist. Stopping here.")
+        return False
+    except Exception as e:
+        logger.error(e)
+        raise
+
+    if recent_uploads_count > 0:
+        logger.info(
+            f"{recent_uploads_count} resumable or started less than {s3_clean_min_age_hours}h ago upload(s) left untouched."
         )
-        logger.debug(
-            f'"s3api list-multipart-uploads" returns code: {proc.returncode} => OK'
+
+    if len(multipart_uploads_list) == 0:
+        logger.info("Nothing to clean.")
+        statistics.append(["s3_clean", 0])
+        return True
+
+    logger.info("Delete in progess...")
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=s3_clean_workers) as executor:
+        futures = {
+            executor.submit(
+                s3.abort_multipart_upload,
+                Bucket=bucket_name,
+                Key=item["Key"],
+                UploadId=item["UploadId"],
+            ): item
+            for item in multipart_uploads_list
+        }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                future.result()
+                logger.info(f"Deleted incomplete upload: \"{item['Key']}\".")
+            except Exception as e:
+                logger.error(e)
+                failed.append(item["Key"])
+
+    deleted_count = len(multipart_uploads_list) - len(failed)
+    statistics.append(["s3_clean", deleted_count])
+    logger.debug(f"{deleted_count} incomplete upload(s) deleted.")
+
+    if len(failed) > 0:
+        logger.critical(
+            f"{len(failed)} incomplete upload(s) could not be deleted!"
         )
-    except Exception as e:
-        if "exit status 254" in str(e):
-            logger.warning(
-                f"Bucket {bucket_name} does not exist. Stopping here."
-            )
+        logger.debug(f"Failed: {failed}")
+        return False
+
+    return True
+
+
+def media_upload_required(
+    media: str = None,
+    video_encode: bool = VIDEO_ENCODE,
+    media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
+) -> bool:
+    """ Returns True if a file of the output tree has to be copied to S3 """
+
+    media_type = get_media_type(basename(media))
+
+    if media_type == "movie":
+        if str(video_encode) == "True" and media_encode_platform == "cloud":
+            return True
+        elif str(video_encode) == "True" and media_encode_platform == "local":
+            logger.info(f"Skipping copy of {media} for local re-encoding.")
             return False
         else:
-            logger.error(e)
-            raise
+            return False
+    elif media_type == "picture":
+        return True
+    else:
+        logger.warning(f"Media type is: {media_type} !")
+        return False
 
-    if proc.returncode == 0 and proc.stdout:
-        multipart_uploads_list = proc.stdout.strip()
-        multipart_uploads_list = json.loads(multipart_uploads_list)["Uploads"]
-        logger.info("Delete in progess...")
-        try:
-            for item in multipart_uploads_list:
-                proc_cmd = f"aws s3api abort-multipart-upload --bucket {bucket_name} --region {aws_region} --key \"{item['Key']}\" --upload-id {item['UploadId']}"
-
-                proc = subprocess.run(
-                    proc_cmd,
-                    shell=True,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                )
 
-                statistics.append(["s3_clean", len(multipart_uploads_list)])
-                logger.debug(
-                    f'"s3api abort-multipart-upload" returns code: {proc.returncode} => OK'
-                )
-                logger.info(f"Deleted incomplete upload: \"{item['Key']}\".")
-            logger.debug(
-                f"{len(multipart_uploads_list)} incomplete upload(s) deleted."
-            )
-        except Exception as e:
-            logger.error(e)
-            raise
+def cloud_encoded_key(
+    key: str = None,
+    video_encode: bool = VIDEO_ENCODE,
+    media_encode_platform: str = MEDIA_ENCODE_PLATFORM,
+    cloud_video_preset: str = CLOUD_VIDEO_PRESET,
+) -> str:
+    """ Returns the key the cloud encoder writes a staged movie to, None if key is not encoded remotely """
 
-        return True
+    if get_media_type(basename(key)) != "movie":
+        return None
+    elif str(video_encode) != "True" or media_encode_platform != "cloud":
+        return None
     else:
-        logger.info("Nothing to clean.")
-        return True
+        preset_format = cloud_video_preset.split(".")[1]
+        return f"{os.path.splitext(key)[0]}.{preset_format}"
 
 
 # replacement of media_sync ?
@@ -292,33 +776,276 @@ def medias_copy(
     try:
         medias = get_local_medias_files(path=local_path, save_to_disk=False)
         logger.debug(medias)
-        for media in medias:
-            media_type = get_media_type(basename(media))
-            ts = media.split("/")[-2]
-
-            if media_type == "movie":
-                if video_encode == "True" and media_encode_platform == "cloud":
-                    send_to_bucket(media, ts)
-                elif (
-                    video_encode == "True" and media_encode_platform == "local"
-                ):
-                    logger.info(
-                        f"Skipping copy of {media} for local re-encoding."
-                    )
-            elif media_type == "picture":
-                send_to_bucket(media, ts)
-            else:
-                logger.warning(f"Media type is: {media_type} !")
+        medias = {
+            media[len(local_path) + 1 :]: media
+            for media in medias
+            if media_upload_required(
+                media, video_encode, media_encode_platform
+            )
+        }
+        medias, unchanged = sync_plan(medias, list_remote_objects())
+        statistics.append(["medias_copy_unchanged", len(unchanged)])
+        results = upload_files(medias)
 
         logger.info(
-            f"{len(medias)} medias files have been successfully copied."
+            f"{len(results['uploaded'])} medias files have been successfully copied."
         )
     except Exception as e:
         logger.error(e)
         raise
 
-    statistics.append(["medias_copy", len(medias)])
+    statistics.append(["medias_copy", len(results["uploaded"])])
+
+    if len(results["failed"]) > 0:
+        logger.critical(f"{len(results['failed'])} file(s) failed to upload!")
+        logger.debug(f"Failed upload(s): {results['failed']}")
+        return False
 
     logger.info("...done.")
 
     return True
+
+
+def upload_files(
+    medias: list = None,
+    s3_upload_workers: int = S3_UPLOAD_WORKERS,
+    s3_resumable_upload: str = S3_RESUMABLE_UPLOAD,
+    s3_upload_verify: str = S3_UPLOAD_VERIFY,
+    cloud_async_concurrency: int = CLOUD_ASYNC_CONCURRENCY,
+) -> dict:
+    """ Upload files of the output tree concurrently, returns uploaded/failed files and throughput """
+
+    assert medias is not None
+    assert type(medias) == list
+
+    results = {"uploaded": [], "failed": [], "bytes": 0, "seconds": 0.0}
+    if len(medias) == 0:
+        return results
+
+    checksum_cache = load_checksum_cache()
+
+    # checkpointed and verified uploads are only implemented with threads
+    if (
+        use_asyncio()
+        and s3_resumable_upload != "True"
+        and s3_upload_verify != "True"
+    ):
+        results = run(upload_files_async(medias))
+        concurrency = f"{cloud_async_concurrency} asyncio request(s)"
+    else:
+        # create the shared client before the threads race for it
+        get_s3_client()
+        tic = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=s3_upload_workers) as executor:
+            futures = {
+                executor.submit(
+                    send_to_bucket,
+                    media,
+                    media.split("/")[-2],
+                    checksum_cache=checksum_cache,
+                ): media
+                for media in medias
+            }
+            for future in as_completed(futures):
+                media = futures[future]
+                try:
+                    future.result()
+                    results["uploaded"].append(media)
+                    results["bytes"] += os.path.getsize(media)
+                except Exception:
+                    # already logged by send_to_bucket()
+                    results["failed"].append(media)
+
+        results["seconds"] = time.perf_counter() - tic
+        concurrency = f"{s3_upload_workers} thread(s)"
+    save_checksum_cache(checksum_cache)
+    inventory_record_uploads(results["uploaded"])
+    throughput = results["bytes"] / (1024 * 1024) / results["seconds"]
+    statistics.append(["upload_files_bytes", results["bytes"]])
+    if upload_throttled_seconds() > 0:
+        statistics.append(
+            ["upload_throttled_seconds", round(upload_throttled_seconds(), 2)]
+        )
+    statistics.append(["upload_files_mb_per_s", round(throughput, 2)])
+    statistics.append(
+        [
+            "upload_files_per_s",
+            round(len(results["uploaded"]) / results["seconds"], 2),
+        ]
+    )
+    logger.info(
+        f"{len(results['uploaded'])} file(s), {results['bytes']} bytes uploaded in {results['seconds']:0.2f}s: {throughput:0.2f} MB/s with {concurrency}."
+    )
+
+    return results
+
+
+def list_remote_objects(
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+    s3_inventory: str = S3_INVENTORY,
+) -> dict:
+    """ Returns {key relative to s3_prefix: {"size", "etag"}} of the objects under s3_prefix """
+
+    if s3_inventory == "True":
+        objects = refresh_inventory(
+            bucket_name=bucket_name, s3_prefix=s3_prefix, aws_region=aws_region
+        )["objects"]
+    else:
+        objects = {
+            obj["Key"]: {"size": obj["Size"], "etag": obj["ETag"].strip('"')}
+            for batch in list_objects_parallel(
+                bucket_name, f"{s3_prefix}/", aws_region
+            )
+            for obj in batch
+        }
+
+    remote = {
+        key[len(s3_prefix) + 1 :]: {"size": item["size"], "etag": item["etag"]}
+        for key, item in objects.items()
+    }
+    logger.debug(
+        f"{len(remote)} object(s) listed in s3://{bucket_name}/{s3_prefix}/."
+    )
+
+    return remote
+
+
+def sync_plan(
+    local_files: dict = None,
+    remote: dict = None,
+    s3_sync_compare: str = S3_SYNC_COMPARE,
+) -> tuple:
+    """ Returns (files to upload, unchanged files) of {relative key: local file} """
+
+    to_upload = []
+    unchanged = []
+    compare = {}
+
+    for key, media in local_files.items():
+        remote_object = remote.get(key)
+        # the encoder deletes the staged movie once its output is written
+        if remote_object is None and cloud_encoded_key(key) in remote:
+            unchanged.append(media)
+        elif remote_object is None:
+            to_upload.append(media)
+        elif os.path.getsize(media) != remote_object["size"]:
+            to_upload.append(media)
+        elif s3_sync_compare == "etag" and remote_object["etag"] is not None:
+            compare[media] = remote_object["etag"]
+        else:
+            unchanged.append(media)
+
+    if len(compare) > 0:
+        # same size: the content decides, cached checksums are not re-hashed
+        checksum_cache = load_checksum_cache()
+        try:
+            etags = local_etags(compare, checksum_cache)
+        finally:
+            save_checksum_cache(checksum_cache)
+        for media, remote_etag in compare.items():
+            if etags[media] != remote_etag:
+                to_upload.append(media)
+            else:
+                unchanged.append(media)
+
+    return (to_upload, unchanged)
+
+
+def delete_remote_objects(
+    keys: list = None,
+    bucket_name: str = BUCKET_NAME,
+    aws_region: str = AWS_REGION,
+) -> tuple:
+    """ Batch delete keys, returns (deleted keys, failed keys) """
+
+    deleted = []
+    failed = []
+    s3 = get_s3_client(aws_region)
+
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[i : i + DELETE_BATCH_SIZE]
+        response = s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                "Objects": [{"Key": key} for key in batch],
+                "Quiet": True,
+            },
+        )
+        errors = [item["Key"] for item in response.get("Errors", [])]
+        for item in response.get("Errors", []):
+            logger.error(
+                f"Could not delete \"{item['Key']}\": {item['Message']}"
+            )
+        failed.extend(errors)
+        deleted.extend([key for key in batch if key not in set(errors)])
+
+    return (deleted, failed)
+
+
+def delta_sync(
+    local_path: str = LOCAL_MEDIA_OUTPUT_PATH,
+    bucket_name: str = BUCKET_NAME,
+    s3_prefix: str = S3_PREFIX,
+    aws_region: str = AWS_REGION,
+    s3_sync_delete: str = S3_SYNC_DELETE,
+    s3_sync_compare: str = S3_SYNC_COMPARE,
+) -> dict:
+    """ Upload new/changed files of local_path and optionally delete orphan objects, returns counts """
+
+    counts = {
+        "uploaded": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "excluded": 0,
+        "failed": 0,
+        "bytes": 0,
+    }
+
+    # same relative paths as the keys below s3_prefix
+    excluded_files = []
+    local_files = {
+        entry.path[len(local_path) + 1 :]: entry.path
+        for entry in walk_local_medias_files(
+            local_path, excluded_files, s3_exclude_matcher
+        )
+    }
+    remote = list_remote_objects(bucket_name, s3_prefix, aws_region)
+
+    to_upload, unchanged = sync_plan(local_files, remote, s3_sync_compare)
+    counts["unchanged"] = len(unchanged)
+    counts["excluded"] = len(excluded_files)
+    logger.info(
+        f"{len(to_upload)} file(s) to upload, {len(unchanged)} unchanged."
+    )
+
+    results = upload_files(to_upload)
+    counts["uploaded"] = len(results["uploaded"])
+    counts["failed"] = len(results["failed"])
+    counts["bytes"] = results["bytes"]
+
+    if s3_sync_delete == "True":
+        # like "aws s3 sync --delete", excluded objects are left alone and
+        # the cloud encoder outputs of staged movies are kept
+        encoded = {cloud_encoded_key(key) for key in local_files}
+        orphans = [
+            f"{s3_prefix}/{key}"
+            for key in remote
+            if key not in local_files
+            and key not in encoded
+            and not is_excluded(key, False, s3_exclude_matcher)
+        ]
+        if len(orphans) > 0:
+            deleted, failed = delete_remote_objects(
+                orphans, bucket_name, aws_region
+            )
+            counts["deleted"] = len(deleted)
+            inventory_remove(deleted)
+            counts["failed"] += len(failed)
+            logger.info(f"{len(deleted)} orphan object(s) deleted.")
+        else:
+            pass
+
+    return counts
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from constants import (
+    S3_UPLOAD_MAX_MB_PER_S,
+    S3_UPLOAD_MAX_REQUESTS_PER_S,
+)
+from init import logger
+
+MB = 1024 * 1024
+
+
+class TokenBucket:
+    """ Token bucket shared by threads and coroutines, a reservation above the balance is paid by waiting """
+
+    def __init__(self, rate: float = 0):
+        self.lock = threading.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: float = 0) -> None:
+        # rate <= 0: unlimited, the bucket holds one second of tokens
+        with self.lock:
+            self.rate = rate
+            self.tokens = rate
+            self.updated = time.monotonic()
+
+    def reserve(self, amount: float = 1) -> float:
+        """ Take amount tokens, returns the seconds to wait before using them """
+
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rate, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # a negative balance makes the next callers wait behind this one
+            self.tokens -= amount
+
+            return max(0.0, -self.tokens / self.rate)
+
+
+# shared by every upload thread/coroutine of the run
+upload_limits = {
+    "bytes": TokenBucket(S3_UPLOAD_MAX_MB_PER_S * MB),
+    "requests": TokenBucket(S3_UPLOAD_MAX_REQUESTS_PER_S),
+}
+upload_waits = {"seconds": 0.0}
+upload_waits_lock = threading.Lock()
+
+
+def set_upload_limits(
+    s3_upload_max_mb_per_s: float = S3_UPLOAD_MAX_MB_PER_S,
+    s3_upload_max_requests_per_s: float = S3_UPLOAD_MAX_REQUESTS_PER_S,
+) -> None:
+    """ Set the upload limits of this run, 0 for unlimited """
+
+    upload_limits["bytes"].set_rate(s3_upload_max_mb_per_s * MB)
+    upload_limits["requests"].set_rate(s3_upload_max_requests_per_s)
+    logger.debug(
+        f"Upload limits: {s3_upload_max_mb_per_s} MB/s, {s3_upload_max_requests_per_s} request(s)/s (0: unlimited)."
+    )
+
+
+def upload_delay(size: int = 0, requests: int = 1) -> float:
+    """ Reserve size bytes and requests, returns the seconds to wait before sending them """
+
+    delay = 0.0
+    # a retried transfer reports negative progress: nothing to reserve
+    if size > 0:
+        delay = upload_limits["bytes"].reserve(size)
+    if requests > 0:
+        delay = max(delay, upload_limits["requests"].reserve(requests))
+
+    if delay > 0:
+        with upload_waits_lock:
+            upload_waits["seconds"] += delay
+
+    return delay
+
+
+def wait_upload(size: int = 0, requests: int = 1) -> None:
+    """ Block until size bytes and requests can be sent """
+
+    delay = upload_delay(size, requests)
+    if delay > 0:
+        time.sleep(delay)
+
+
+async def wait_upload_async(size: int = 0, requests: int = 1) -> None:
+    """ Wait, without blocking the event loop, until size bytes and requests can be sent """
+
+    delay = upload_delay(size, requests)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def throttled_call(size: int = 0, call=None, **kwargs):
+    """ Send one request of size bytes within the upload limits """
+
+    wait_upload(size)
+    return call(**kwargs)
+
+
+def throttle_callback(bytes_amount: int = 0) -> None:
+    """ Managed transfer progress callback: slows the transfer threads down to the bytes limit """
+
+    wait_upload(bytes_amount, 0)
+
+
+def upload_throttled_seconds() -> float:
+    """ Returns the time uploads have waited on the limits, summed over the workers """
+
+    return upload_waits["seconds"]
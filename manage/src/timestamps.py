@@ -0,0 +1,161 @@
+import os
+import struct
+import shutil
+from datetime import datetime, timedelta
+from PIL import Image
+from constants import FILES_LIST_PATH, MEDIA_TS_CACHE_FILENAME
+from init import logger
+from helpers import (
+    load_json_store,
+    save_json_store,
+    file_signature,
+    get_media_type,
+)
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+# ISO base media (mp4/mov) dates are seconds since 1904-01-01
+MP4_EPOCH = datetime(1904, 1, 1)
+MP4_FORMATS = (".mp4", ".m4v", ".mov", ".3gp")
+# zeroed/unset clocks are not capture dates
+MIN_YEAR = 1971
+
+
+def load_ts_cache(
+    files_list_path: str = FILES_LIST_PATH,
+    media_ts_cache_filename: str = MEDIA_TS_CACHE_FILENAME,
+) -> dict:
+    """ Load the media => capture date cache """
+
+    return load_json_store(f"{files_list_path}/{media_ts_cache_filename}")
+
+
+def save_ts_cache(
+    ts_cache: dict = None,
+    files_list_path: str = FILES_LIST_PATH,
+    media_ts_cache_filename: str = MEDIA_TS_CACHE_FILENAME,
+) -> bool:
+    """ Save the media => capture date cache """
+
+    save_json_store(f"{files_list_path}/{media_ts_cache_filename}", ts_cache)
+    logger.debug(f"{len(ts_cache)} entries saved to timestamp cache.")
+
+    return True
+
+
+def format_ts(date: datetime = None) -> str:
+    """ Returns "YYYYMMDD" or None when the date is not plausible """
+
+    if date is None or date.year < MIN_YEAR or date > datetime.now():
+        return None
+    else:
+        return date.strftime("%Y%m%d")
+
+
+def picture_exif_ts(media: str = None) -> str:
+    """ Returns the EXIF capture date of a picture (headers only) """
+
+    with Image.open(media) as im:
+        exif = im.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(
+            EXIF_DATETIME
+        )
+
+    if not value:
+        return None
+
+    try:
+        return format_ts(
+            datetime.strptime(str(value).strip("\x00 ")[:19], EXIF_DATE_FORMAT)
+        )
+    except ValueError:
+        return None
+
+
+def mp4_creation_ts(media: str = None) -> str:
+    """ Returns the creation date of a mp4/mov file from its 'mvhd' atom """
+
+    with open(media, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        offset = 0
+
+        # walk top level atoms up to 'moov', then its children up to 'mvhd'
+        while offset + 8 <= end:
+            f.seek(offset)
+            size, kind = struct.unpack(">I4s", f.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = end - offset
+            if size < header:
+                return None
+
+            if kind == b"moov":
+                end = offset + size
+                offset += header
+            elif kind == b"mvhd":
+                version = f.read(1)[0]
+                f.read(3)
+                if version == 1:
+                    seconds = struct.unpack(">Q", f.read(8))[0]
+                else:
+                    seconds = struct.unpack(">I", f.read(4))[0]
+                return format_ts(MP4_EPOCH + timedelta(seconds=seconds))
+            else:
+                offset += size
+
+    return None
+
+
+def movie_container_ts(media: str = None) -> str:
+    """ Returns the container creation date of a movie """
+
+    if media.lower().endswith(MP4_FORMATS):
+        return mp4_creation_ts(media)
+    elif shutil.which("ffprobe"):
+        # other containers: ffprobe only reads the headers too
+        from probe import probe_media
+
+        creation_time = probe_media(media)["creation_time"]
+        if creation_time:
+            return format_ts(
+                datetime.strptime(creation_time[:19], "%Y-%m-%dT%H:%M:%S")
+            )
+    else:
+        pass
+
+    return None
+
+
+def media_metadata_ts(media: str = None, ts_cache: dict = None) -> str:
+    """ Returns the capture date ("YYYYMMDD") stored in a media, cached by path/size/mtime """
+
+    signature = file_signature(media)
+    entry = ts_cache.get(media)
+    if (
+        entry
+        and entry["size"] == signature["size"]
+        and entry["mtime"] == signature["mtime"]
+    ):
+        return entry["ts"]
+
+    media_type = get_media_type(media)
+    try:
+        if media_type == "picture":
+            media_ts = picture_exif_ts(media)
+        elif media_type == "movie":
+            media_ts = movie_container_ts(media)
+        else:
+            media_ts = None
+    except Exception as e:
+        logger.debug(f'No metadata date for "{media}": {e}')
+        media_ts = None
+
+    # misses are cached too, the folder name is used for them
+    ts_cache[media] = dict(signature, ts=media_ts)
+
+    return media_ts